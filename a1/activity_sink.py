@@ -0,0 +1,157 @@
+"""Writing the activities of a simulation to disk
+
+An ActivitySink collects the activities a Monitor is notified about and writes
+them to a gzip-compressed file in large batches. Each batch is stored column
+by column (all timestamps, then all categories, and so on), which keeps
+similar values together and makes them compress well. read_activities reads
+such a file back one activity at a time.
+
+=== Constants ===
+CATEGORIES: The activity categories, in the order they are encoded.
+DESCRIPTIONS: The activity descriptions, in the order they are encoded.
+"""
+
+from __future__ import annotations
+import gzip
+import struct
+from typing import BinaryIO, Iterator, List, Tuple
+from location import Location
+from monitor import Activity, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+
+CATEGORIES = (RIDER, DRIVER)
+DESCRIPTIONS = (REQUEST, CANCEL, PICKUP, DROPOFF)
+
+_BATCH_HEADER = struct.Struct("<II")
+
+
+class ActivitySink:
+    """A compressed, columnar file of activities, written in batches.
+
+    === Attributes ===
+    batch_size: The number of activities held in memory before they are
+        written out together.
+    written: The number of activities written so far.
+    """
+    # === Private Attributes ===
+    # _file: the compressed file being written.
+    # _times, _categories, _descriptions, _ids, _rows, _cols: the columns of
+    #     the activities in the current, unwritten batch.
+
+    batch_size: int
+    written: int
+    _file: BinaryIO
+    _times: List[int]
+    _categories: List[int]
+    _descriptions: List[int]
+    _ids: List[str]
+    _rows: List[int]
+    _cols: List[int]
+
+    def __init__(self, filename: str, batch_size: int = 65536) -> None:
+        """Create the activity file <filename>, replacing any existing file.
+
+        """
+        self.batch_size = batch_size
+        self.written = 0
+        self._file = gzip.open(filename, "wb")
+        self._clear_batch()
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return f"ActivitySink ({self.written} activities written)"
+
+    def __enter__(self) -> ActivitySink:
+        """Return this sink, to be closed at the end of a with block.
+
+        """
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close this sink at the end of a with block.
+
+        """
+        self.close()
+
+    def _clear_batch(self) -> None:
+        """Empty the columns of the current batch.
+
+        """
+        self._times = []
+        self._categories = []
+        self._descriptions = []
+        self._ids = []
+        self._rows = []
+        self._cols = []
+
+    def write(self, timestamp: int, category: str, description: str,
+              identifier: str, location: Location) -> None:
+        """Add an activity to the current batch, writing the batch out if it
+        is full.
+
+        """
+        self._times.append(timestamp)
+        self._categories.append(CATEGORIES.index(category))
+        self._descriptions.append(DESCRIPTIONS.index(description))
+        self._ids.append(identifier)
+        self._rows.append(location.location[0])
+        self._cols.append(location.location[1])
+        if len(self._times) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write out the activities in the current batch.
+
+        """
+        count = len(self._times)
+        if count == 0:
+            return
+        ids = "\n".join(self._ids).encode()
+        self._file.write(_BATCH_HEADER.pack(count, len(ids)))
+        self._file.write(struct.pack(f"<{count}q", *self._times))
+        self._file.write(bytes(self._categories))
+        self._file.write(bytes(self._descriptions))
+        self._file.write(struct.pack(f"<{count}i", *self._rows))
+        self._file.write(struct.pack(f"<{count}i", *self._cols))
+        self._file.write(ids)
+        self.written += count
+        self._clear_batch()
+
+    def close(self) -> None:
+        """Write out the current batch and close the file.
+
+        """
+        self.flush()
+        self._file.close()
+
+
+def read_activities(filename: str) -> Iterator[Tuple[str, Activity]]:
+    """Return an iterator over the (category, activity) pairs in the activity
+    file <filename>, in the order they were written.
+
+    """
+    with gzip.open(filename, "rb") as file:
+        header = file.read(_BATCH_HEADER.size)
+        while header:
+            count, ids_size = _BATCH_HEADER.unpack(header)
+            times = struct.unpack(f"<{count}q", file.read(8 * count))
+            categories = file.read(count)
+            descriptions = file.read(count)
+            rows = struct.unpack(f"<{count}i", file.read(4 * count))
+            cols = struct.unpack(f"<{count}i", file.read(4 * count))
+            ids = file.read(ids_size).decode().split("\n")
+            for i in range(count):
+                yield CATEGORIES[categories[i]], Activity(
+                    times[i], DESCRIPTIONS[descriptions[i]], ids[i],
+                    Location(rows[i], cols[i]))
+            header = file.read(_BATCH_HEADER.size)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['ActivitySink.__init__', 'read_activities'],
+            'extra-imports': ['gzip', 'struct', 'typing', 'location',
+                              'monitor']})
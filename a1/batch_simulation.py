@@ -0,0 +1,447 @@
+"""Running many small simulations at once
+
+A BatchSimulation runs many independent scenarios, each described by its own
+list of initial events, in lockstep. Instead of one object per driver, rider
+and event, the state of every scenario is kept in NumPy arrays indexed by
+(scenario, driver), (scenario, rider) and (scenario, pending event). Each step
+does the next event of every unfinished scenario at once, with array
+operations over the scenarios that are doing the same kind of event.
+
+Every scenario follows the rules of Simulation with the default Dispatcher
+and Monitor exactly, so its report is the one Simulation.run would return for
+the same events.
+
+=== Constants ===
+RIDER_REQUEST, DRIVER_REQUEST, CANCELLATION, PICKUP, DROPOFF: The kinds of
+    event, as stored in the pending event arrays.
+"""
+
+from typing import Dict, List, Tuple
+import numpy as np
+from event import Event, DriverRequest, RiderRequest
+from histogram import Histogram
+from monitor import PERCENTILES
+
+RIDER_REQUEST = 0
+DRIVER_REQUEST = 1
+CANCELLATION = 2
+PICKUP = 3
+DROPOFF = 4
+
+# Rider statuses, as stored in the rider arrays.
+_WAITING = 0
+_CANCELLED = 1
+_SATISFIED = 2
+
+_NEVER = np.iinfo(np.int64).max
+# Pending events are ordered by a single key, timestamp << _SEQ_BITS | order
+# of scheduling, so that finding the next one is a single argmin.
+_SEQ_BITS = 24
+
+
+class BatchSimulation:
+    """A simulation of many independent scenarios, run side by side.
+
+    === Attributes ===
+    steps: The number of lockstep steps the last run took, which is the
+        largest number of events done by any one scenario.
+    """
+    # === Private Attributes ===
+    # Scenarios are indexed by s, drivers by d, riders by r and pending event
+    # slots by e. Unused driver, rider and event slots are padding.
+    #
+    # Drivers:
+    # _d_row, _d_col, _d_dest_row, _d_dest_col: location and destination.
+    # _d_speed: speed.
+    # _d_idle: whether the driver is idle.
+    # _d_registered: whether the driver has registered with the dispatcher.
+    # _d_order: the order in which the driver registered.
+    # _d_seen: whether the monitor has been notified about the driver.
+    # _d_last_row, _d_last_col: the location of the driver's last activity.
+    # _d_last_pickup: whether the driver's last activity was a pickup.
+    # _d_count, _d_registered_count: per scenario, the number of drivers
+    #     the monitor has seen and the number that have registered.
+    # _total_distance, _ride_distance: per scenario, the distance driven by
+    #     all drivers, and driven with a rider.
+    #
+    # Riders:
+    # _r_row, _r_col, _r_dest_row, _r_dest_col: origin and destination.
+    # _r_patience: patience.
+    # _r_status: one of _WAITING, _CANCELLED or _SATISFIED.
+    # _r_waiting: whether the rider is on the dispatcher's waiting list.
+    # _r_waiting_order: when the rider joined the waiting list.
+    # _r_since: when the rider requested a ride.
+    # _r_timing: whether the monitor is still timing the rider's wait.
+    # _waiting_count: per scenario, how many riders have joined the waiting
+    #     list.
+    # _wait_total, _wait_count: per scenario, the sum and number of
+    #     finished waits.
+    #
+    # Pending events:
+    # _e_time, _e_kind, _e_rider, _e_driver: timestamp, kind and
+    #     participants of each event.
+    # _e_key: the order key of each event, or _NEVER if the slot is free.
+    # _next_seq: per scenario, the number of events scheduled so far.
+    # _pending: per scenario, the number of events not yet done.
+    #
+    # _waits, _trips: the wait times and trip distances recorded in each
+    #     step, as (scenario indices, values) pairs.
+
+    steps: int
+
+    def __init__(self) -> None:
+        """Initialize a BatchSimulation.
+
+        """
+        self.steps = 0
+
+    def run(self, scenarios: List[List[Event]]) -> List[Dict[str, float]]:
+        """Run one simulation for each list of initial events in <scenarios>
+        and return their reports, in the same order.
+
+        Precondition: every initial event is a DriverRequest or a
+        RiderRequest, ids are unique within a scenario, and no scenario
+        schedules 2 ** 24 events or has timestamps of 2 ** 39 or more.
+        """
+        self._load(scenarios)
+        self.steps = 0
+        active = np.arange(len(scenarios))
+        while len(active) > 0:
+            self._step(active)
+            self.steps += 1
+            active = active[self._pending[active] > 0]
+        waits = _histograms(self._waits, len(scenarios))
+        trips = _histograms(self._trips, len(scenarios))
+        return [self._report(s, waits[s], trips[s])
+                for s in range(len(scenarios))]
+
+    def _load(self, scenarios: List[List[Event]]) -> None:
+        """Create the state arrays and schedule the initial events of
+        <scenarios>.
+
+        """
+        drivers = [[e.driver for e in events if isinstance(e, DriverRequest)]
+                   for events in scenarios]
+        riders = [[e.rider for e in events if isinstance(e, RiderRequest)]
+                  for events in scenarios]
+        n = len(scenarios)
+        n_drivers = max([len(ds) for ds in drivers] + [1])
+        n_riders = max([len(rs) for rs in riders] + [1])
+        # A rider has at most one request or cancellation pending, and a
+        # driver at most a pickup or dropoff and a driver request.
+        n_events = n_riders + 2 * n_drivers
+
+        def ints(width: int, value: int = 0) -> np.ndarray:
+            return np.full((n, width), value, dtype=np.int64)
+
+        def flags(width: int) -> np.ndarray:
+            return np.zeros((n, width), dtype=bool)
+
+        self._d_row, self._d_col = ints(n_drivers), ints(n_drivers)
+        self._d_dest_row, self._d_dest_col = ints(n_drivers), ints(n_drivers)
+        self._d_speed = ints(n_drivers, 1)
+        self._d_idle = ~flags(n_drivers)
+        self._d_registered, self._d_seen = flags(n_drivers), flags(n_drivers)
+        self._d_order = ints(n_drivers)
+        self._d_last_row, self._d_last_col = ints(n_drivers), ints(n_drivers)
+        self._d_last_pickup = flags(n_drivers)
+        self._d_count, self._d_registered_count = ints(1)[:, 0], ints(1)[:, 0]
+        self._total_distance, self._ride_distance = \
+            ints(1)[:, 0], ints(1)[:, 0]
+
+        self._r_row, self._r_col = ints(n_riders), ints(n_riders)
+        self._r_dest_row, self._r_dest_col = ints(n_riders), ints(n_riders)
+        self._r_patience = ints(n_riders)
+        self._r_status = ints(n_riders, _WAITING)
+        self._r_waiting, self._r_timing = flags(n_riders), flags(n_riders)
+        self._r_waiting_order, self._r_since = ints(n_riders), ints(n_riders)
+        self._waiting_count = ints(1)[:, 0]
+        self._wait_total, self._wait_count = ints(1)[:, 0], ints(1)[:, 0]
+
+        self._e_time, self._e_kind = ints(n_events), ints(n_events)
+        self._e_rider, self._e_driver = ints(n_events), ints(n_events)
+        self._e_key = ints(n_events, _NEVER)
+        self._next_seq, self._pending = ints(1)[:, 0], ints(1)[:, 0]
+        self._waits, self._trips = [], []
+
+        for s, events in enumerate(scenarios):
+            driver_index, rider_index = {}, {}
+            for e, event in enumerate(events):
+                self._e_time[s, e] = event.timestamp
+                self._e_key[s, e] = (event.timestamp << _SEQ_BITS) | e
+                if isinstance(event, DriverRequest):
+                    d = driver_index.setdefault(event.driver.id,
+                                                len(driver_index))
+                    self._d_row[s, d], self._d_col[s, d] = \
+                        event.driver.location.location
+                    self._d_speed[s, d] = event.driver.speed
+                    self._e_kind[s, e] = DRIVER_REQUEST
+                    self._e_driver[s, e] = d
+                else:
+                    r = rider_index.setdefault(event.rider.id,
+                                               len(rider_index))
+                    self._r_row[s, r], self._r_col[s, r] = \
+                        event.rider.origin.location
+                    self._r_dest_row[s, r], self._r_dest_col[s, r] = \
+                        event.rider.destination.location
+                    self._r_patience[s, r] = event.rider.patience
+                    self._e_kind[s, e] = RIDER_REQUEST
+                    self._e_rider[s, e] = r
+            self._next_seq[s] = self._pending[s] = len(events)
+
+    def _step(self, active: np.ndarray) -> None:
+        """Do the next event of each scenario in <active>.
+
+        Precondition: every scenario in <active> has an event pending.
+        """
+        # The next event has the smallest timestamp and, among those, was
+        # scheduled first; this is the order of Simulation's event queue.
+        if len(active) == len(self._e_key):
+            slot = self._e_key.argmin(axis=1)
+        else:
+            slot = self._e_key[active].argmin(axis=1)
+
+        self._e_key[active, slot] = _NEVER
+        self._pending[active] -= 1
+        time = self._e_time[active, slot]
+        kind = self._e_kind[active, slot]
+        rider = self._e_rider[active, slot]
+        driver = self._e_driver[active, slot]
+
+        for event_kind, do in ((RIDER_REQUEST, self._do_rider_request),
+                               (DRIVER_REQUEST, self._do_driver_request),
+                               (CANCELLATION, self._do_cancellation),
+                               (PICKUP, self._do_pickup),
+                               (DROPOFF, self._do_dropoff)):
+            chosen = kind == event_kind
+            if chosen.any():
+                do(active[chosen], time[chosen], rider[chosen],
+                   driver[chosen])
+
+    def _schedule(self, s: np.ndarray, time: np.ndarray, kind: int,
+                  rider: np.ndarray, driver: np.ndarray) -> None:
+        """Schedule one event of <kind> in each scenario in <s>.
+
+        Precondition: the scenarios in <s> are distinct.
+        """
+        if len(s) == 0:
+            return
+        slot = self._e_key[s].argmax(axis=1)
+        self._e_time[s, slot] = time
+        self._e_key[s, slot] = (time << _SEQ_BITS) | self._next_seq[s]
+        self._e_kind[s, slot] = kind
+        self._e_rider[s, slot] = rider
+        self._e_driver[s, slot] = driver
+        self._next_seq[s] += 1
+        self._pending[s] += 1
+
+    def _travel_time(self, s: np.ndarray, d: np.ndarray, row: np.ndarray,
+                     col: np.ndarray) -> np.ndarray:
+        """Return how long driver <d> of each scenario in <s> takes to reach
+        (row, col), rounded half to even like Driver.get_travel_time.
+
+        <d>, <row> and <col> may have an extra trailing axis of drivers.
+        """
+        distance = np.abs(self._d_row[s, d] - row) + \
+            np.abs(self._d_col[s, d] - col)
+        return np.rint(distance / self._d_speed[s, d]).astype(np.int64)
+
+    def _start_drive(self, s: np.ndarray, d: np.ndarray, row: np.ndarray,
+                     col: np.ndarray) -> np.ndarray:
+        """Start driver <d> of each scenario in <s> driving to (row, col) and
+        return the time the drive will take.
+
+        """
+        self._d_dest_row[s, d], self._d_dest_col[s, d] = row, col
+        self._d_idle[s, d] = False
+        return self._travel_time(s, d, row, col)
+
+    def _end_drive(self, s: np.ndarray, d: np.ndarray) -> None:
+        """End the drive of driver <d> of each scenario in <s>.
+
+        """
+        self._d_row[s, d] = self._d_dest_row[s, d]
+        self._d_col[s, d] = self._d_dest_col[s, d]
+        self._d_idle[s, d] = True
+
+    def _notify_driver(self, s: np.ndarray, d: np.ndarray, row: np.ndarray,
+                       col: np.ndarray, dropoff: bool, pickup: bool) -> None:
+        """Advance the odometers of driver <d> of each scenario in <s> for an
+        activity at (row, col), as Monitor.notify does.
+
+        """
+        seen = self._d_seen[s, d]
+        self._d_count[s[~seen]] += 1
+        self._d_seen[s, d] = True
+        distance = np.abs(self._d_last_row[s, d] - row) + \
+            np.abs(self._d_last_col[s, d] - col)
+        distance[~seen] = 0
+        self._total_distance[s] += distance
+        if dropoff:
+            trip = self._d_last_pickup[s, d] & seen
+            self._ride_distance[s[trip]] += distance[trip]
+            self._trips.append((s[trip], distance[trip]))
+        self._d_last_row[s, d], self._d_last_col[s, d] = row, col
+        self._d_last_pickup[s, d] = pickup
+
+    def _end_wait(self, s: np.ndarray, r: np.ndarray,
+                  time: np.ndarray) -> None:
+        """Record the end of the wait of rider <r> of each scenario in <s>,
+        if it is still being timed.
+
+        """
+        timing = self._r_timing[s, r]
+        s, r, time = s[timing], r[timing], time[timing]
+        wait = time - self._r_since[s, r]
+        self._r_timing[s, r] = False
+        self._wait_total[s] += wait
+        self._wait_count[s] += 1
+        self._waits.append((s, wait))
+
+    def _do_rider_request(self, s: np.ndarray, time: np.ndarray,
+                          r: np.ndarray, _: np.ndarray) -> None:
+        """Do a RiderRequest for rider <r> in each scenario in <s>.
+
+        """
+        self._r_since[s, r] = time
+        self._r_timing[s, r] = True
+        row, col = self._r_row[s, r], self._r_col[s, r]
+
+        # The closest idle, registered driver, ties going to the one that
+        # registered first.
+        everyone = np.arange(self._d_row.shape[1])
+        candidates = self._d_idle[s] & self._d_registered[s]
+        travel = np.where(
+            candidates,
+            self._travel_time(s[:, None], everyone[None, :], row[:, None],
+                              col[:, None]),
+            _NEVER)
+        closest = candidates & (travel == travel.min(axis=1, keepdims=True))
+        d = np.where(closest, self._d_order[s], _NEVER).argmin(axis=1)
+        found = candidates.any(axis=1)
+
+        unmatched = s[~found], r[~found]
+        self._r_waiting[unmatched] = True
+        self._r_waiting_order[unmatched] = self._waiting_count[s[~found]]
+        self._waiting_count[s[~found]] += 1
+
+        s_found, d_found, r_found = s[found], d[found], r[found]
+        travel_found = self._start_drive(s_found, d_found, row[found],
+                                         col[found])
+        self._schedule(s_found, time[found] + travel_found, PICKUP, r_found,
+                       d_found)
+
+        # Simulation drops a spawned event that has the same timestamp as
+        # one spawned before it by the same event.
+        cancel_time = time + self._r_patience[s, r]
+        same = np.zeros(len(s), dtype=bool)
+        same[found] = cancel_time[found] == time[found] + travel_found
+        self._schedule(s[~same], cancel_time[~same], CANCELLATION, r[~same],
+                       np.zeros(np.count_nonzero(~same), dtype=np.int64))
+
+    def _do_driver_request(self, s: np.ndarray, time: np.ndarray,
+                           _: np.ndarray, d: np.ndarray) -> None:
+        """Do a DriverRequest for driver <d> in each scenario in <s>.
+
+        """
+        self._notify_driver(s, d, self._d_row[s, d], self._d_col[s, d],
+                            False, False)
+
+        new = ~self._d_registered[s, d]
+        self._d_registered[s[new], d[new]] = True
+        self._d_order[s[new], d[new]] = self._d_registered_count[s[new]]
+        self._d_registered_count[s[new]] += 1
+
+        # The rider who has waited longest, for drivers that are idle.
+        waiting = self._r_waiting[s]
+        found = self._d_idle[s, d] & waiting.any(axis=1)
+        s, time, d = s[found], time[found], d[found]
+        r = np.where(waiting[found], self._r_waiting_order[s],
+                     _NEVER).argmin(axis=1)
+        self._r_waiting[s, r] = False
+        travel = self._start_drive(s, d, self._r_row[s, r], self._r_col[s, r])
+        self._schedule(s, time + travel, PICKUP, r, d)
+
+    def _do_cancellation(self, s: np.ndarray, time: np.ndarray,
+                         r: np.ndarray, _: np.ndarray) -> None:
+        """Do a Cancellation for rider <r> in each scenario in <s>.
+
+        """
+        waiting = self._r_status[s, r] == _WAITING
+        s, time, r = s[waiting], time[waiting], r[waiting]
+        self._r_status[s, r] = _CANCELLED
+        self._r_waiting[s, r] = False
+        self._end_wait(s, r, time)
+
+    def _do_pickup(self, s: np.ndarray, time: np.ndarray, r: np.ndarray,
+                   d: np.ndarray) -> None:
+        """Do a Pickup of rider <r> by driver <d> in each scenario in <s>.
+
+        """
+        self._end_drive(s, d)
+
+        cancelled = self._r_status[s, r] == _CANCELLED
+        self._schedule(s[cancelled], time[cancelled], DRIVER_REQUEST,
+                       r[cancelled], d[cancelled])
+
+        s, time, r, d = s[~cancelled], time[~cancelled], r[~cancelled], \
+            d[~cancelled]
+        ride = self._start_drive(s, d, self._r_dest_row[s, r],
+                                 self._r_dest_col[s, r])
+        self._r_status[s, r] = _SATISFIED
+        self._notify_driver(s, d, self._r_row[s, r], self._r_col[s, r],
+                            False, True)
+        self._end_wait(s, r, time)
+        self._schedule(s, time + ride, DROPOFF, r, d)
+
+    def _do_dropoff(self, s: np.ndarray, time: np.ndarray, r: np.ndarray,
+                    d: np.ndarray) -> None:
+        """Do a Dropoff of rider <r> by driver <d> in each scenario in <s>.
+
+        """
+        self._end_drive(s, d)
+        self._notify_driver(s, d, self._d_row[s, d], self._d_col[s, d],
+                            True, False)
+        self._schedule(s, time, DRIVER_REQUEST, r, d)
+
+    def _report(self, s: int, waits: Histogram,
+                trips: Histogram) -> Dict[str, float]:
+        """Return the report of scenario <s>, whose wait times and trip
+        distances are in <waits> and <trips>, as Monitor.report would.
+
+        """
+        waits_done, drivers = int(self._wait_count[s]), int(self._d_count[s])
+        report = {
+            "rider_wait_time":
+                int(self._wait_total[s]) / waits_done if waits_done else 0.0,
+            "driver_total_distance":
+                int(self._total_distance[s]) / drivers if drivers else 0.0,
+            "driver_ride_distance":
+                int(self._ride_distance[s]) / drivers if drivers else 0.0}
+        for name, histogram in (("rider_wait_time", waits),
+                                ("trip_distance", trips)):
+            for percentile in PERCENTILES:
+                report[f"{name}_p{percentile}"] = \
+                    float(histogram.quantile(percentile / 100))
+        return report
+
+
+def _histograms(log: List[Tuple[np.ndarray, np.ndarray]],
+                n: int) -> List[Histogram]:
+    """Return a histogram for each of <n> scenarios of the values recorded
+    for it in <log>.
+
+    """
+    histograms = [Histogram() for _ in range(n)]
+    for scenarios, values in log:
+        for s, value in zip(scenarios.tolist(), values.tolist()):
+            histograms[s].record(value)
+    return histograms
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'extra-imports': ['typing', 'numpy', 'event', 'histogram',
+                              'monitor']})
@@ -0,0 +1,67 @@
+"""Reading compressed events files
+
+An events file may be compressed with gzip, xz or bzip2. open_trace tells them
+apart from plain text by their first bytes and decompresses them as they are
+read, through large buffers, so a compressed trace never has to be written
+out to disk before a simulation can use it.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+from typing import Callable, Optional, TextIO
+
+# Reading in large blocks keeps the number of calls into the decompressor,
+# and the per-call overhead that comes with them, small.
+BUFFER_SIZE = 1 << 20
+
+_FORMATS = ((b"\x1f\x8b", gzip.open),
+            (b"\xfd7zXZ\x00", lzma.open),
+            (b"BZh", bz2.open))
+
+
+def _opener(filename: str) -> Optional[Callable]:
+    """Return the function that opens <filename> for decompression, or None
+    if it is not compressed in a format we know.
+
+    """
+    with open(filename, "rb") as file:
+        magic = file.read(6)
+    for prefix, opener in _FORMATS:
+        if magic.startswith(prefix):
+            return opener
+    return None
+
+
+def is_compressed(filename: str) -> bool:
+    """Return True iff <filename> is compressed with gzip, xz or bzip2.
+
+    >>> is_compressed("events.txt")
+    False
+    """
+    return _opener(filename) is not None
+
+
+def open_trace(filename: str) -> TextIO:
+    """Open the events file <filename> for reading as text, decompressing it
+    if it is compressed.
+
+    >>> with open_trace("events.txt") as file:
+    ...     file.readline().strip()
+    '# Sample Event List'
+    """
+    opener = _opener(filename)
+    if opener is None:
+        return open(filename, "r", buffering=BUFFER_SIZE)
+    stream = io.BufferedReader(opener(filename, "rb"),
+                               buffer_size=BUFFER_SIZE)
+    return io.TextIOWrapper(stream)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['_opener', 'open_trace'],
+            'extra-imports': ['bz2', 'gzip', 'io', 'lzma', 'typing']})
@@ -1,5 +1,8 @@
 """Containers of objects"""
 
+import heapq
+from typing import Iterable
+
 
 class Container:
     """A container that holds objects.
@@ -13,6 +16,13 @@ class Container:
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def add_all(self, items: Iterable) -> None:
+        """Add every item in <items> to this Container, in order.
+
+        """
+        for item in items:
+            self.add(item)
+
     def remove(self) -> object:
         """Remove and return a single item from this Container.
 
@@ -45,17 +55,24 @@ class PriorityQueue(Container):
 
     # === Private Attributes ===
     _items: list
-    #     The items stored in the priority queue.
+    #     The items stored in the priority queue, each as an (item, order)
+    #     pair, where order is the number of items added before it.
+    _added: int
+    #     The number of items that have ever been added to the queue.
     #
     # === Representation Invariants ===
-    # _items is a sorted list, where the first item in the queue is the
-    # item with the highest priority.
+    # _items is a binary min-heap of (item, order) pairs: for every index i,
+    # _items[i] <= _items[2 * i + 1] and _items[i] <= _items[2 * i + 2] when
+    # those exist. Comparing pairs compares the items first and the orders
+    # second, so the first pair is the highest priority item that was added
+    # earliest.
 
     def __init__(self) -> None:
         """Initialize an empty PriorityQueue.
 
         """
         self._items = []
+        self._added = 0
 
     def remove(self) -> object:
         """Remove and return the next item from this PriorityQueue.
@@ -76,12 +93,7 @@ class PriorityQueue(Container):
         >>> pq.remove()
         'yellow'
         """
-        priority_item = self._items[0]
-        for item in self._items:
-            if item.__lt__(priority_item):
-                priority_item = item
-        self._items.remove(priority_item)
-        return priority_item
+        return heapq.heappop(self._items)[0]
 
     def is_empty(self) -> bool:
         """
@@ -96,6 +108,28 @@ class PriorityQueue(Container):
         """
         return len(self._items) == 0
 
+    def __len__(self) -> int:
+        """Return the number of items in this PriorityQueue.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add_all(["red", "blue"])
+        >>> len(pq)
+        2
+        """
+        return len(self._items)
+
+    def peek(self) -> object:
+        """Return the next item in this PriorityQueue without removing it.
+
+        Precondition: <self> should not be empty.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add_all(["red", "blue"])
+        >>> pq.peek()
+        'blue'
+        """
+        return self._items[0][0]
+
     def add(self, item: object) -> None:
         """Add <item> to this PriorityQueue.
 
@@ -104,30 +138,51 @@ class PriorityQueue(Container):
         >>> pq.add("blue")
         >>> pq.add("red")
         >>> pq.add("green")
-        >>> pq._items
+        >>> [pq.remove() for _ in range(4)]
         ['blue', 'green', 'red', 'yellow']
         """
-        if self.is_empty():
-            self._items.append(item)
+        heapq.heappush(self._items, (item, self._added))
+        self._added += 1
+
+    def add_all(self, items: Iterable) -> None:
+        """Add every item in <items> to this PriorityQueue, in order.
+
+        This takes time linear in the number of items in the queue. If the
+        queue is empty and <items> is already in priority order, the items
+        are used as they are; otherwise the queue is rebuilt in one pass.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add_all(["yellow", "blue", "red", "green"])
+        >>> [pq.remove() for _ in range(4)]
+        ['blue', 'green', 'red', 'yellow']
+        """
+        start = self._added
+        entries = [(item, start + i) for i, item in enumerate(items)]
+        self._added += len(entries)
+
+        if not self._items and _in_order(entries):
+            # A list in priority order is already a heap.
+            self._items = entries
         else:
-            i = 0
-            while i < len(self._items):
-                if item.__lt__(self._items[i]):
-                    self._items.insert(i, item)
-                    return
-                elif item.__le__(self._items[i]):
-                    self._items.insert(i + 1, item)
-                    return
-                i += 1
-            if item not in self._items:
-                self._items.append(item)
-
-        # ["yellow"]
-        # ["blue", "yellow"]
-        # ["blue", "red", "yellow"]
-        # ["blue", "green", "red", "yellow"]
+            self._items.extend(entries)
+            heapq.heapify(self._items)
+
+
+def _in_order(entries: list) -> bool:
+    """Return True iff no item in <entries> has a higher priority than the
+    item before it.
+
+    >>> _in_order([(1, 0), (1, 1), (2, 2)])
+    True
+    >>> _in_order([(2, 0), (1, 1)])
+    False
+    """
+    for i in range(1, len(entries)):
+        if entries[i][0] < entries[i - 1][0]:
+            return False
+    return True
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all()
+    python_ta.check_all(config={'extra-imports': ['heapq', 'typing']})
@@ -1,8 +1,18 @@
-"""Dispatcher for the simulation"""
+"""Dispatcher for the simulation
 
-from typing import Optional
+=== Constants ===
+OLDEST: A policy that gives a free driver the rider who has waited longest.
+NEAREST: A policy that gives a free driver the waiting rider closest to them.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional
 from driver import Driver
 from rider import Rider
+from spatial import GridIndex
+
+OLDEST = "oldest"
+NEAREST = "nearest"
 
 
 class Dispatcher:
@@ -18,72 +28,156 @@ class Dispatcher:
     the waiting list to the driver. If there is no rider on the waiting list
     the dispatcher does nothing. Once a driver requests a rider, the driver
     is registered with the dispatcher, and will be used to fulfill future
-    rider requests.
+    rider requests. Which waiting rider a driver gets depends on the
+    dispatcher's policy, OLDEST or NEAREST.
+
+    === Attributes ===
+    policy: How a waiting rider is chosen for a driver.
     """
     # # === Private Attributes ===
-    # _riders_waiting: a priority-based waiting list for riders
-    # _drivers: a list of drivers available to pickup
+    # _riders_waiting: the waiting list for riders, keyed by id, in the order
+    #     they started waiting
+    # _waiting_origins: the origins of the waiting riders, keyed by rider id.
+    #     Only kept under the NEAREST policy.
+    # _drivers: every registered driver, keyed by id
+    # _idle_drivers: the registered drivers that are not driving, keyed by id.
+    #     This is the partition that rider requests are matched against.
+    # _busy_drivers: the registered drivers that are driving, keyed by id
+    # _order: the position in which each driver registered, keyed by id. Ties
+    #     between equally close drivers go to the earliest registered one,
+    #     however often the driver has moved between the partitions.
 
     # Attribute types
-    _riders_waiting: list
-    _drivers: list
+    policy: str
+    _riders_waiting: OrderedDict
+    _waiting_origins: Optional[GridIndex]
+    _drivers: Dict[str, Driver]
+    _idle_drivers: Dict[str, Driver]
+    _busy_drivers: Dict[str, Driver]
+    _order: Dict[str, int]
 
-    def __init__(self) -> None:
-        """Initialize a Dispatcher.
+    def __init__(self, policy: str = OLDEST) -> None:
+        """Initialize a Dispatcher that gives out waiting riders by <policy>.
 
         """
-        self._riders_waiting = []
-        self._drivers = []
+        self.policy = policy
+        self._riders_waiting = OrderedDict()
+        self._waiting_origins = GridIndex() if policy == NEAREST else None
+        self._drivers = {}
+        self._idle_drivers = {}
+        self._busy_drivers = {}
+        self._order = {}
 
     def __str__(self) -> str:
         """Return a string representation.
 
         """
         return f"There are {len(self._riders_waiting)} riders waiting and " \
-               f"{len(self._drivers)} drivers are to pick up."
+               f"{len(self._idle_drivers)} drivers are to pick up."
+
+    def waiting_count(self) -> int:
+        """Return the number of riders on the waiting list.
+
+        """
+        return len(self._riders_waiting)
+
+    def idle_count(self) -> int:
+        """Return the number of registered drivers that are not driving.
+
+        """
+        return len(self._idle_drivers)
+
+    def busy_count(self) -> int:
+        """Return the number of registered drivers that are driving.
+
+        """
+        return len(self._busy_drivers)
 
     def request_driver(self, rider: Rider) -> Optional[Driver]:
         """Return a driver for the rider, or None if no driver is available.
 
-        Add the rider to the waiting list if there is no available driver.
+        Only idle drivers are considered; the closest one is chosen. Add the
+        rider to the waiting list if there is no available driver.
 
         """
         min_distance = float('inf')
+        min_order = 0
         chosen_driver = None
-        for driver in self._drivers:
+        for driver in self._idle_drivers.values():
             distance = driver.get_travel_time(rider.origin)
-            if distance < min_distance:
+            order = self._order[driver.id]
+            if distance < min_distance or \
+                    (distance == min_distance and order < min_order):
                 min_distance = distance
+                min_order = order
                 chosen_driver = driver
-        if chosen_driver is None and rider not in self._riders_waiting:
-            self._riders_waiting.append(rider)
-        if chosen_driver is not None:
-            return chosen_driver
-        else:
-            return None
+        if chosen_driver is None and rider.id not in self._riders_waiting:
+            self._riders_waiting[rider.id] = rider
+            if self._waiting_origins is not None:
+                self._waiting_origins.add(rider.id, rider.origin)
+        return chosen_driver
 
     def request_rider(self, driver: Driver) -> Optional[Rider]:
         """Return a rider for the driver, or None if no rider is available.
 
         If this is a new driver, register the driver for future rider requests.
+        A driver that is busy (for example, one that was assigned to a rider
+        at the same moment it asked for one) is not given another rider.
 
         """
-        if driver not in self._drivers:
-            self._drivers.append(driver)
-        if self._riders_waiting != []:
-            return self._riders_waiting.pop(0)
-        else:
+        if driver.id not in self._drivers:
+            self._register(driver)
+        if driver.id in self._busy_drivers:
             return None
+        if not self._riders_waiting:
+            return None
+        if self._waiting_origins is None:
+            return self._riders_waiting.popitem(last=False)[1]
+        rider_id = self._waiting_origins.nearest(driver.location)
+        self._waiting_origins.remove(rider_id)
+        return self._riders_waiting.pop(rider_id)
+
+    def driver_busy(self, driver: Driver) -> None:
+        """Move the registered <driver> into the busy partition.
+
+        """
+        if driver.id in self._idle_drivers:
+            del self._idle_drivers[driver.id]
+            self._busy_drivers[driver.id] = driver
+
+    def driver_idle(self, driver: Driver) -> None:
+        """Move the registered <driver> into the idle partition.
+
+        """
+        if driver.id in self._busy_drivers:
+            del self._busy_drivers[driver.id]
+            self._idle_drivers[driver.id] = driver
+
+    def _register(self, driver: Driver) -> None:
+        """Register <driver> for future rider requests.
+
+        """
+        self._order[driver.id] = len(self._drivers)
+        self._drivers[driver.id] = driver
+        if driver.is_idle:
+            self._idle_drivers[driver.id] = driver
+        else:
+            self._busy_drivers[driver.id] = driver
+        driver.assign_dispatcher(self)
 
     def cancel_ride(self, rider: Rider) -> None:
         """Cancel the ride for rider.
 
         """
         rider.status = "cancelled"
-        if rider in self._riders_waiting:
-            self._riders_waiting.remove(rider)
+        if rider.id in self._riders_waiting:
+            del self._riders_waiting[rider.id]
+            if self._waiting_origins is not None:
+                self._waiting_origins.remove(rider.id)
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all(config={'extra-imports': ['typing', 'driver', 'rider']})
+    python_ta.check_all(config={'extra-imports': ['collections', 'typing',
+                                                  'driver', 'rider',
+                                                  'spatial']})
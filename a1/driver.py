@@ -1,9 +1,13 @@
 """Drivers for the simulation"""
 
-from typing import Optional
+from __future__ import annotations
+from typing import Optional, TYPE_CHECKING
 from location import Location, manhattan_distance
 from rider import Rider
 
+if TYPE_CHECKING:
+    from dispatcher import Dispatcher
+
 
 class Driver:
     """A driver for a ride-sharing service.
@@ -15,11 +19,18 @@ class Driver:
     destination: The final location of the driver.
     speed: The speed at which this driver drives
     """
+    # === Private Attributes ===
+    # _dispatcher: the dispatcher this driver is registered with, or None if
+    #     the driver has not requested a rider yet. It is told whenever the
+    #     driver starts or ends a drive, so that it can keep its idle and
+    #     busy drivers apart.
+
     destination: Optional[Location]
     id: str
     location: Location
     is_idle: bool
     speed: int
+    _dispatcher: Optional[Dispatcher]
 
     def __init__(self, identifier: str, location: Location, speed: int) -> None:
         """Initialize a Driver.
@@ -30,6 +41,7 @@ class Driver:
         self.is_idle = True
         self.destination = None
         self.speed = speed
+        self._dispatcher = None
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -43,6 +55,19 @@ class Driver:
         """
         return self.id == other.id
 
+    def __hash__(self) -> int:
+        """Return a hash value consistent with __eq__.
+
+        """
+        return hash(self.id)
+
+    def assign_dispatcher(self, dispatcher: Dispatcher) -> None:
+        """Record <dispatcher> as the dispatcher this driver is registered
+        with.
+
+        """
+        self._dispatcher = dispatcher
+
     def get_travel_time(self, destination: Location) -> int:
         """Return the time it will take to arrive at the destination,
         rounded to the nearest integer.
@@ -58,6 +83,8 @@ class Driver:
         """
         self.destination = location
         self.is_idle = False
+        if self._dispatcher is not None:
+            self._dispatcher.driver_busy(self)
         return self.get_travel_time(location)
 
     def end_drive(self) -> None:
@@ -68,6 +95,8 @@ class Driver:
         self.is_idle = True
         self.location = self.destination
         self.destination = None
+        if self._dispatcher is not None:
+            self._dispatcher.driver_idle(self)
 
     def start_ride(self, rider: Rider) -> int:
         """Start a ride and return the time the ride will take.
@@ -88,4 +117,4 @@ class Driver:
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
-        config={'extra-imports': ['location', 'rider']})
+        config={'extra-imports': ['location', 'rider', 'dispatcher']})
@@ -4,10 +4,11 @@ This file should contain all of the classes necessary to model the different
 kinds of events in the simulation.
 """
 from __future__ import annotations
-from typing import List
+from typing import List, Optional
 from rider import Rider, WAITING, CANCELLED, SATISFIED
 from dispatcher import Dispatcher
 from driver import Driver
+from compression import open_trace
 from location import deserialize_location
 from monitor import Monitor, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
 
@@ -354,54 +355,69 @@ def create_event_list(filename: str) -> List[Event]:
     """Return a list of Events based on raw list of events in <filename>.
 
     Precondition: the file stored at <filename> is in the format specified
-    by the assignment handout.
+    by the assignment handout, possibly compressed with gzip, xz or bzip2.
 
     filename: The name of a file that contains the list of events.
     """
     events = []
-    with open(filename, "r") as file:
+    with open_trace(filename) as file:
         for line in file:
-            line = line.strip()
-
-            if not line or line.startswith("#"):
-                # Skip lines that are blank or start with #.
-                continue
-
-            # Create a list of words in the line, e.g.
-            # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
-            # Note that these are strings, and you'll need to convert some
-            # of them to a different type.
-            tokens = line.split()
-            timestamp = int(tokens[0])
-            event_type = tokens[1]
-            # HINT: Use Location.deserialize to convert the location string to
-            # a location.
-
-            if event_type == "DriverRequest":
-                driver_id = tokens[2]
-                driver_location = deserialize_location(tokens[3])
-                driver = Driver(driver_id, driver_location, int(tokens[4]))
-                event = DriverRequest(timestamp, driver)
-            elif event_type == "RiderRequest":
-                rider_id = tokens[2]
-                rider_origin = deserialize_location(tokens[3])
-                rider_destination = deserialize_location(tokens[4])
-                rider = Rider(rider_id, int(tokens[5]),
-                              rider_origin, rider_destination)
-                event = RiderRequest(timestamp, rider)
-            else:
-                event = None
-
+            event = parse_event(line)
             if event is not None:
                 events.append(event)
 
     return events
 
 
+def parse_event(line: str) -> Optional[Event]:
+    """Return the Event described by one <line> of an events file, or None if
+    the line does not describe an event.
+
+    Precondition: <line> is in the format specified by the assignment handout.
+
+    >>> parse_event("0 DriverRequest Amaranth 1,1 1").driver.id
+    'Amaranth'
+    >>> parse_event("# a comment") is None
+    True
+    """
+    line = line.strip()
+
+    if not line or line.startswith("#"):
+        # Skip lines that are blank or start with #.
+        return None
+
+    # Create a list of words in the line, e.g.
+    # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
+    # Note that these are strings, and you'll need to convert some
+    # of them to a different type.
+    tokens = line.split()
+    timestamp = int(tokens[0])
+    event_type = tokens[1]
+    # HINT: Use Location.deserialize to convert the location string to
+    # a location.
+
+    if event_type == "DriverRequest":
+        driver_id = tokens[2]
+        driver_location = deserialize_location(tokens[3])
+        driver = Driver(driver_id, driver_location, int(tokens[4]))
+        event = DriverRequest(timestamp, driver)
+    elif event_type == "RiderRequest":
+        rider_id = tokens[2]
+        rider_origin = deserialize_location(tokens[3])
+        rider_destination = deserialize_location(tokens[4])
+        rider = Rider(rider_id, int(tokens[5]),
+                      rider_origin, rider_destination)
+        event = RiderRequest(timestamp, rider)
+    else:
+        event = None
+
+    return event
+
+
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
         config={
             'allowed-io': ['create_event_list'],
             'extra-imports': ['rider', 'dispatcher', 'driver',
-                              'location', 'monitor']})
+                              'compression', 'location', 'monitor']})
@@ -0,0 +1,151 @@
+"""Counting activities by where they happen
+
+A Heatmap counts the activities a Monitor is notified about in square cells of
+the grid, with one layer of counts for each category and description, e.g.
+rider requests (demand) or driver requests (supply). The counts are kept in a
+dense NumPy array that grows to cover every cell an activity happens in, so
+recording an activity takes constant time and no activities need to be kept.
+
+Note that a rider's dropoff is reported at the rider's origin; the driver
+layer has the location where the ride actually ended.
+"""
+
+from typing import Dict, Tuple
+import numpy as np
+from location import Location
+from monitor import RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+
+_LAYERS = tuple((category, description)
+                for category in (RIDER, DRIVER)
+                for description in (REQUEST, CANCEL, PICKUP, DROPOFF))
+
+
+class Heatmap:
+    """Per-cell counts of the activities in a simulation.
+
+    === Attributes ===
+    cell_size: The width and height of a cell, in blocks.
+    """
+    # === Private Attributes ===
+    # _counts: _counts[layer, i, j] is the number of activities of the
+    #     layer'th (category, description) pair of _LAYERS in the cell
+    #     (_first_row + i, _first_col + j).
+    # _first_row, _first_col: the cell that _counts[:, 0, 0] counts.
+    # _layer: the index of each (category, description) pair in _counts.
+
+    cell_size: int
+    _counts: np.ndarray
+    _first_row: int
+    _first_col: int
+    _layer: Dict[Tuple[str, str], int]
+
+    def __init__(self, cell_size: int = 1) -> None:
+        """Initialize an empty Heatmap with cells of <cell_size> blocks.
+
+        """
+        self.cell_size = cell_size
+        self._counts = np.zeros((len(_LAYERS), 0, 0), dtype=np.int64)
+        self._first_row = self._first_col = 0
+        self._layer = {pair: i for i, pair in enumerate(_LAYERS)}
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        _, rows, cols = self._counts.shape
+        return f"Heatmap ({rows} x {cols} cells of {self.cell_size} blocks)"
+
+    def record(self, category: str, description: str,
+               location: Location) -> None:
+        """Count an activity of <category> and <description> at <location>.
+
+        >>> heatmap = Heatmap()
+        >>> heatmap.record(RIDER, REQUEST, Location(2, 3))
+        >>> heatmap.record(RIDER, REQUEST, Location(3, 3))
+        >>> heatmap.origin()
+        (2, 3)
+        >>> heatmap.layer(RIDER, REQUEST).tolist()
+        [[1], [1]]
+        """
+        row = location.location[0] // self.cell_size - self._first_row
+        col = location.location[1] // self.cell_size - self._first_col
+        _, rows, cols = self._counts.shape
+        if not (0 <= row < rows and 0 <= col < cols):
+            self._grow(row, col)
+            row = location.location[0] // self.cell_size - self._first_row
+            col = location.location[1] // self.cell_size - self._first_col
+        self._counts[self._layer[(category, description)], row, col] += 1
+
+    def _grow(self, row: int, col: int) -> None:
+        """Enlarge the counts to cover the cell at index (row, col), at least
+        doubling each dimension that has to grow.
+
+        """
+        _, rows, cols = self._counts.shape
+        if rows == 0:
+            # The first cell starts a small grid of its own.
+            self._first_row += row
+            self._first_col += col
+            self._counts = np.zeros((len(_LAYERS), 1, 1), dtype=np.int64)
+            return
+        below, above = _extra(row, rows)
+        left, right = _extra(col, cols)
+        self._counts = np.pad(self._counts,
+                              ((0, 0), (below, above), (left, right)))
+        self._first_row -= below
+        self._first_col -= left
+
+    def origin(self) -> Tuple[int, int]:
+        """Return the (row, column) of the first block of the cell that
+        [0, 0] of every layer counts.
+
+        """
+        return self._first_row * self.cell_size, \
+            self._first_col * self.cell_size
+
+    def layer(self, category: str, description: str) -> np.ndarray:
+        """Return the counts of the activities of <category> and
+        <description>, indexed by cell relative to origin().
+
+        The result is a copy, so it is unaffected by later activities.
+        """
+        return self._counts[self._layer[(category, description)]].copy()
+
+    def layers(self) -> Dict[str, np.ndarray]:
+        """Return a copy of every layer, keyed "<category>_<description>",
+        e.g. "rider_request".
+
+        """
+        return {f"{category}_{description}": self.layer(category, description)
+                for category, description in _LAYERS}
+
+    def save(self, filename: str) -> None:
+        """Write every layer, the origin and the cell size to the compressed
+        NumPy archive <filename>.
+
+        """
+        np.savez_compressed(filename, origin=np.array(self.origin()),
+                            cell_size=np.array(self.cell_size),
+                            **self.layers())
+
+
+def _extra(index: int, size: int) -> Tuple[int, int]:
+    """Return how many cells to add before and after a dimension of <size>
+    cells so that it covers <index>.
+
+    >>> _extra(-1, 4)
+    (4, 0)
+    >>> _extra(9, 4)
+    (0, 6)
+    """
+    if index < 0:
+        return max(-index, size), 0
+    if index >= size:
+        return 0, max(index + 1 - size, size)
+    return 0, 0
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={'extra-imports': ['typing', 'numpy', 'location', 'monitor']})
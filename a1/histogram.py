@@ -0,0 +1,128 @@
+"""Fixed-memory histograms for the simulation"""
+
+from __future__ import annotations
+import math
+from typing import List
+
+
+class Histogram:
+    """A histogram of non-negative integer values, such as rider wait times or
+    trip distances, that answers quantile queries in a fixed amount of memory.
+
+    Values below 2 ** precision are counted exactly. Larger values share a
+    bucket with the values that agree with them in their <precision> most
+    significant bits, so a reported quantile overestimates the true one by at
+    most a fraction 2 ** (1 - precision) of it. Values above <highest> are
+    counted as <highest>.
+
+    Histograms with the same precision and highest value can be merged, e.g.
+    to combine the results of several simulation runs.
+
+    === Attributes ===
+    precision: The number of significant bits kept for each value.
+    highest: The largest value that is counted exactly to <precision> bits.
+    count: The number of values recorded.
+
+    === Representation Invariants ===
+    - precision >= 1
+    - count is the sum of the bucket counts
+    """
+    # === Private Attributes ===
+    # _counts: _counts[i] is the number of recorded values in bucket i.
+
+    precision: int
+    highest: int
+    count: int
+    _counts: List[int]
+
+    def __init__(self, precision: int = 7, highest: int = 2 ** 32) -> None:
+        """Initialize an empty Histogram.
+
+        >>> Histogram().count
+        0
+        """
+        self.precision = precision
+        self.highest = highest
+        self.count = 0
+        self._counts = [0] * (self._bucket(highest) + 1)
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return f"Histogram of {self.count} values"
+
+    def _bucket(self, value: int) -> int:
+        """Return the index of the bucket that <value> is counted in.
+
+        """
+        if value < 1 << self.precision:
+            return value
+        shift = value.bit_length() - self.precision
+        return (shift << (self.precision - 1)) + (value >> shift)
+
+    def _bucket_value(self, index: int) -> int:
+        """Return the largest value that is counted in bucket <index>.
+
+        """
+        if index < 1 << self.precision:
+            return index
+        shift = (index >> (self.precision - 1)) - 1
+        mantissa = index - (shift << (self.precision - 1))
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        """Record <value> in this Histogram.
+
+        Precondition: value >= 0
+
+        >>> h = Histogram()
+        >>> h.record(3)
+        >>> h.count
+        1
+        """
+        self._counts[self._bucket(min(value, self.highest))] += 1
+        self.count += 1
+
+    def merge(self, other: Histogram) -> None:
+        """Add the values recorded in <other> to this Histogram.
+
+        Precondition: other has the same precision and highest value as self.
+
+        >>> first, second = Histogram(), Histogram()
+        >>> first.record(1)
+        >>> second.record(2)
+        >>> first.merge(second)
+        >>> first.quantile(1.0)
+        2
+        """
+        for i, count in enumerate(other._counts):
+            self._counts[i] += count
+        self.count += other.count
+
+    def quantile(self, q: float) -> int:
+        """Return the value below or at which a fraction <q> of the recorded
+        values lie, or 0 if no values have been recorded.
+
+        Precondition: 0 <= q <= 1
+
+        >>> h = Histogram()
+        >>> for value in range(1, 101):
+        ...     h.record(value)
+        >>> h.quantile(0.5), h.quantile(0.95), h.quantile(0.99)
+        (50, 95, 99)
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return self._bucket_value(i)
+        return self.highest
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['math', 'typing']})
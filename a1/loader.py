@@ -0,0 +1,312 @@
+"""Loading large event traces for the simulation
+
+An events file can be parsed in parallel: it is split into chunks at line
+boundaries, each chunk is parsed and sorted by a separate process, and the
+sorted chunks are merged back into one stream ordered by timestamp. Events
+with equal timestamps keep the order they have in the file, so running a
+simulation on the stream gives the same result as running it on
+create_event_list(filename).
+
+The worker processes send back each event as a record, a tuple of strings
+and integers, rather than as an Event: unpickling a graph of Events, Drivers,
+Riders and Locations in the parent took longer than parsing the whole file
+there. The Events are made from the records one at a time as they are
+merged.
+
+A compressed file cannot be split at byte offsets, so it is decompressed as
+one stream and cut into chunks of whole lines as it is read instead.
+
+An events file that is too large to sort in memory can be sorted with
+sort_trace or sorted_events, which sort it in runs that are spilled to
+temporary files and then merged.
+"""
+
+import heapq
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+from compression import is_compressed, open_trace
+from driver import Driver
+from event import DriverRequest, Event, RiderRequest, parse_event
+from location import Location
+from rider import Rider
+
+# The number of lines of a compressed file in each chunk that is parsed.
+_LINES_PER_CHUNK = 1 << 16
+# The most sorted runs that are merged at once, which bounds the number of
+# temporary files open together.
+_MAX_MERGE = 64
+
+# An event as a worker process sends it back: (timestamp, driver id, row,
+# column, speed) for a DriverRequest, and (timestamp, rider id, origin row,
+# origin column, destination row, destination column, patience) for a
+# RiderRequest.
+_Record = Union[Tuple[int, str, int, int, int],
+                Tuple[int, str, int, int, int, int, int]]
+# The timestamp of a record; the sort key for merging chunks.
+_record_timestamp = itemgetter(0)
+
+
+def load_events(filename: str,
+                processes: Optional[int] = None) -> Iterator[Event]:
+    """Return an iterator over the Events in <filename>, in timestamp order.
+
+    The file is parsed by a pool of <processes> worker processes, or one per
+    CPU if <processes> is None.
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout, possibly compressed with gzip, xz or bzip2.
+
+    >>> [event.timestamp for event in load_events("events.txt", 2)][6:9]
+    [0, 5, 10]
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if is_compressed(filename):
+        with open_trace(filename) as file, \
+                ProcessPoolExecutor(max_workers=processes) as pool:
+            parsed = list(pool.map(_parse_lines, _line_chunks(file)))
+    else:
+        bounds = _chunk_bounds(filename, processes)
+        chunks = [(filename, start, end) for start, end in bounds]
+        if len(chunks) <= 1:
+            parsed = [_parse_chunk(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                parsed = list(pool.map(_parse_chunk, chunks))
+
+    # heapq.merge takes from the earlier chunk when two timestamps are
+    # equal, which keeps such events in file order.
+    return map(_record_event,
+               heapq.merge(*parsed, key=_record_timestamp))
+
+
+def _chunk_bounds(filename: str, chunks: int) -> List[Tuple[int, int]]:
+    """Return the (start, end) byte offsets of at most <chunks> consecutive
+    pieces of <filename>, each of which starts at the beginning of a line.
+
+    """
+    size = os.path.getsize(filename)
+    starts = [0]
+    with open(filename, "rb") as file:
+        for i in range(1, chunks):
+            target = size * i // chunks
+            if target <= starts[-1]:
+                continue
+            # Finish the line that holds the byte before <target>, so that
+            # the next chunk starts on a fresh line.
+            file.seek(target - 1)
+            file.readline()
+            if starts[-1] < file.tell() < size:
+                starts.append(file.tell())
+    ends = starts[1:] + [size]
+    return [(start, end) for start, end in zip(starts, ends) if start < end]
+
+
+def _parse_chunk(chunk: Tuple[str, int, int]) -> List[_Record]:
+    """Return the records of the events in the (filename, start, end) byte
+    range <chunk>, sorted by timestamp with ties kept in file order.
+
+    """
+    filename, start, end = chunk
+    with open(filename, "rb") as file:
+        file.seek(start)
+        text = file.read(end - start).decode()
+    return _parse_lines(text.splitlines())
+
+
+def _line_chunks(file: Iterator[str]) -> Iterator[List[str]]:
+    """Return an iterator over consecutive lists of _LINES_PER_CHUNK lines
+    of <file>; the last may be shorter.
+
+    """
+    chunk = list(islice(file, _LINES_PER_CHUNK))
+    while chunk:
+        yield chunk
+        chunk = list(islice(file, _LINES_PER_CHUNK))
+
+
+def _parse_lines(lines: List[str]) -> List[_Record]:
+    """Return the records of the events in <lines>, sorted by timestamp with
+    ties kept in the order of <lines>.
+
+    """
+    records = []
+    for line in lines:
+        record = _parse_record(line)
+        if record is not None:
+            records.append(record)
+    # list.sort is stable, so events with equal timestamps keep file order.
+    records.sort(key=_record_timestamp)
+    return records
+
+
+def _parse_record(line: str) -> Optional[_Record]:
+    """Return the record of the event described by one <line> of an events
+    file, or None if the line does not describe an event, as parse_event
+    does.
+
+    >>> _parse_record("10 RiderRequest Cerise 4,2 1,5 15")
+    (10, 'Cerise', 4, 2, 1, 5, 15)
+    """
+    tokens = line.split()
+    if not tokens or tokens[0].startswith("#"):
+        return None
+    if tokens[1] == "DriverRequest":
+        row, column = tokens[3].split(",")
+        return (int(tokens[0]), tokens[2], int(row), int(column),
+                int(tokens[4]))
+    if tokens[1] == "RiderRequest":
+        origin_row, origin_column = tokens[3].split(",")
+        destination_row, destination_column = tokens[4].split(",")
+        return (int(tokens[0]), tokens[2], int(origin_row),
+                int(origin_column), int(destination_row),
+                int(destination_column), int(tokens[5]))
+    return None
+
+
+def _record_event(record: _Record) -> Event:
+    """Return the Event that <record> describes.
+
+    >>> _record_event((0, 'Amaranth', 1, 1, 1)).driver.id
+    'Amaranth'
+    """
+    if len(record) == 5:
+        timestamp, driver_id, row, column, speed = record
+        return DriverRequest(timestamp,
+                             Driver(driver_id, Location(row, column), speed))
+    timestamp, rider_id, origin_row, origin_column, destination_row, \
+        destination_column, patience = record
+    return RiderRequest(timestamp,
+                        Rider(rider_id, patience,
+                              Location(origin_row, origin_column),
+                              Location(destination_row, destination_column)))
+
+
+def sort_trace(filename: str, sorted_filename: str,
+               run_lines: int = 1 << 20) -> int:
+    """Write the events in <filename> to <sorted_filename>, one per line in
+    timestamp order, and return the number of events written.
+
+    Events with equal timestamps keep the order they have in <filename>.
+    At most <run_lines> lines are held in memory at once.
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout, possibly compressed.
+    """
+    count = 0
+    with open(sorted_filename, "w") as output:
+        for line in sorted_lines(filename, run_lines):
+            output.write(line)
+            count += 1
+    return count
+
+
+def sorted_events(filename: str, run_lines: int = 1 << 20) -> Iterator[Event]:
+    """Return an iterator over the Events in <filename> in timestamp order,
+    with ties in file order, holding at most <run_lines> lines in memory.
+    Simulation.run reads the iterator one event at a time, so a trace too
+    large for memory can be simulated straight from it.
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout, possibly compressed.
+
+    >>> [event.timestamp for event in sorted_events("events.txt", 4)][6:9]
+    [0, 5, 10]
+    """
+    for line in sorted_lines(filename, run_lines):
+        yield parse_event(line)
+
+
+def sorted_lines(filename: str, run_lines: int = 1 << 20) -> Iterator[str]:
+    """Return an iterator over the event lines of <filename> in timestamp
+    order, with ties in file order. Blank lines and comments are dropped.
+
+    The file is read in runs of <run_lines> event lines. Each run is sorted
+    in memory and spilled to a temporary file, and the runs are then merged,
+    _MAX_MERGE at a time.
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout, possibly compressed.
+    """
+    with tempfile.TemporaryDirectory(prefix="trace-sort-") as directory:
+        runs = []
+        with open_trace(filename) as file:
+            lines = _event_lines(file)
+            run = list(islice(lines, run_lines))
+            while run:
+                # list.sort is stable, so ties keep file order within a run.
+                run.sort(key=_line_timestamp)
+                runs.append(_spill(directory, run))
+                run = list(islice(lines, run_lines))
+
+        # Merging runs that are next to each other, earlier runs first,
+        # keeps ties in file order across runs too.
+        while len(runs) > _MAX_MERGE:
+            merged = []
+            for i in range(0, len(runs), _MAX_MERGE):
+                group = runs[i:i + _MAX_MERGE]
+                merged.append(_spill(directory, _merge_runs(group)))
+                for run_filename in group:
+                    os.remove(run_filename)
+            runs = merged
+        yield from _merge_runs(runs)
+
+
+def _event_lines(file: TextIO) -> Iterator[str]:
+    """Return an iterator over the lines of <file> that describe events,
+    stripped and ending in a newline.
+
+    """
+    for line in file:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line + "\n"
+
+
+def _spill(directory: str, lines: Iterable[str]) -> str:
+    """Write <lines> to a new run file in <directory> and return its name.
+
+    """
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".run",
+                                     delete=False) as run:
+        run.writelines(lines)
+    return run.name
+
+
+def _merge_runs(run_filenames: List[str]) -> Iterator[str]:
+    """Return an iterator over the lines of the sorted run files
+    <run_filenames>, merged in timestamp order; ties come from the earlier
+    run first.
+
+    """
+    with ExitStack() as stack:
+        runs = [stack.enter_context(open(run_filename, "r"))
+                for run_filename in run_filenames]
+        yield from heapq.merge(*runs, key=_line_timestamp)
+
+
+def _line_timestamp(line: str) -> int:
+    """Return the timestamp of the event line <line>.
+
+    >>> _line_timestamp("10 RiderRequest Cerise 4,2 1,5 15")
+    10
+    """
+    return int(line.split(None, 1)[0])
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['_chunk_bounds', '_parse_chunk', 'sort_trace',
+                           '_spill', '_merge_runs'],
+            'extra-imports': ['heapq', 'os', 'tempfile', 'concurrent.futures',
+                              'contextlib', 'itertools', 'operator',
+                              'typing', 'compression', 'driver', 'event',
+                              'location', 'rider']})
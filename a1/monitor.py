@@ -14,11 +14,19 @@ REQUEST: A constant used for the request activity description.
 CANCEL: A constant used for the cancel activity description.
 PICKUP: A constant used for the pickup activity description.
 DROPOFF: A constant used for the dropoff activity description.
+PERCENTILES: The percentiles of rider wait time and trip distance that are
+    included in a report.
 """
 
-from typing import Dict, List
+from __future__ import annotations
+from typing import Dict, List, Optional, TYPE_CHECKING
+from histogram import Histogram
 from location import Location, manhattan_distance
 
+if TYPE_CHECKING:
+    from activity_sink import ActivitySink
+    from heatmap import Heatmap
+
 RIDER = "rider"
 DRIVER = "driver"
 
@@ -27,6 +35,8 @@ CANCEL = "cancel"
 PICKUP = "pickup"
 DROPOFF = "dropoff"
 
+PERCENTILES = (50, 95, 99)
+
 
 class Activity:
     """An activity that occurs in the simulation.
@@ -61,6 +71,13 @@ class Activity:
 class Monitor:
     """A monitor keeps a record of activities that it is notified about.
     When required, it generates a report of the activities it has recorded.
+
+    A monitor can be given an ActivitySink. It then writes every activity to
+    the sink instead of keeping it, and holds only the running totals that
+    its report needs.
+
+    A monitor can also be given a Heatmap, which it counts every activity in
+    by location.
     """
 
     # === Private Attributes ===
@@ -69,9 +86,37 @@ class Monitor:
     #       dictionary. The key of the second dictionary is an identifier
     #       and its value is a list of Activities.
     # {rider: {id1: [], ...}, driver: {id2: [], ...}}
-
-    def __init__(self) -> None:
-        """Initialize a Monitor.
+    #       This stays empty if the monitor has a sink.
+    _sink: Optional[ActivitySink]
+    #       Where activities are written, or None to keep them in
+    #       _activities.
+    _heatmap: Optional[Heatmap]
+    #       Where activities are counted by location, if anywhere.
+    _riders: int
+    #       The number of riders that have requested a ride.
+    _waiting_since: Dict[str, int]
+    #       The time each rider who is still waiting requested a ride, keyed
+    #       by rider id.
+    _total_wait_time: int
+    #       The sum of the wait times of riders that have finished waiting.
+    _finished_waiting: int
+    #       The number of riders that have finished waiting.
+    _last_driver_activity: Dict[str, Activity]
+    #       The most recent activity of each driver, keyed by driver id.
+    _total_distance: Dict[str, int]
+    #       The distance each driver has driven so far, keyed by driver id.
+    _ride_distance: Dict[str, int]
+    #       The distance each driver has driven with a rider, keyed by
+    #       driver id.
+    _wait_times: Histogram
+    #       The wait times of riders that have finished waiting.
+    _trip_distances: Histogram
+    #       The distance of every completed ride.
+
+    def __init__(self, sink: Optional[ActivitySink] = None,
+                 heatmap: Optional[Heatmap] = None) -> None:
+        """Initialize a Monitor that writes its activities to <sink> and
+        counts them in <heatmap>, if they are given.
 
         """
         self._activities = {
@@ -79,13 +124,24 @@ class Monitor:
             DRIVER: {}
         }
         """@type _activities: d'ict[str, dict[str, list[Activity]]]"""
+        self._sink = sink
+        self._heatmap = heatmap
+        self._riders = 0
+        self._waiting_since = {}
+        self._total_wait_time = 0
+        self._finished_waiting = 0
+        self._last_driver_activity = {}
+        self._total_distance = {}
+        self._ride_distance = {}
+        self._wait_times = Histogram()
+        self._trip_distances = Histogram()
 
     def __str__(self) -> str:
         """Return a string representation.
 
         """
         return "Monitor ({} drivers, {} riders)".format(
-            len(self._activities[DRIVER]), len(self._activities[RIDER]))
+            len(self._total_distance), self._riders)
 
     def notify(self, timestamp: int, category: str, description: str,
                identifier: str, location: Location) -> None:
@@ -98,66 +154,103 @@ class Monitor:
         identifier: The identifier for the actor.
         location: The location of the activity.
         """
-        if identifier not in self._activities[category]:
-            self._activities[category][identifier] = []
-
         activity = Activity(timestamp, description, identifier, location)
-        self._activities[category][identifier].append(activity)
+        if self._sink is not None:
+            self._sink.write(timestamp, category, description, identifier,
+                             location)
+        else:
+            if identifier not in self._activities[category]:
+                self._activities[category][identifier] = []
+            self._activities[category][identifier].append(activity)
+        if self._heatmap is not None:
+            self._heatmap.record(category, description, location)
+
+        if category == RIDER:
+            self._record_rider(activity)
+        else:
+            self._record_driver(activity)
+
+    def _record_rider(self, activity: Activity) -> None:
+        """Update the wait time totals with the rider <activity>.
+
+        """
+        if activity.description == REQUEST:
+            self._riders += 1
+            self._waiting_since[activity.id] = activity.time
+        elif activity.id in self._waiting_since:
+            # The activity after REQUEST is PICKUP or CANCEL, which ends the
+            # wait. A later DROPOFF finds the rider no longer waiting.
+            wait_time = activity.time - self._waiting_since.pop(activity.id)
+            self._total_wait_time += wait_time
+            self._finished_waiting += 1
+            self._wait_times.record(wait_time)
+
+    def _record_driver(self, activity: Activity) -> None:
+        """Advance the odometers of the driver doing <activity>.
+
+        """
+        previous = self._last_driver_activity.get(activity.id)
+        if previous is None:
+            self._total_distance[activity.id] = 0
+            self._ride_distance[activity.id] = 0
+        else:
+            distance = manhattan_distance(previous.location, activity.location)
+            self._total_distance[activity.id] += distance
+            if previous.description == PICKUP and \
+                    activity.description == DROPOFF:
+                self._ride_distance[activity.id] += distance
+                self._trip_distances.record(distance)
+        self._last_driver_activity[activity.id] = activity
 
     def report(self) -> Dict[str, float]:
         """Return a report of the activities that have occurred.
 
+        Besides the averages, the report holds each of the PERCENTILES of
+        rider wait time and trip distance, e.g. "rider_wait_time_p95".
         """
-        return {"rider_wait_time": self._average_wait_time(),
-                "driver_total_distance": self._average_total_distance(),
-                "driver_ride_distance": self._average_ride_distance()}
+        report = {"rider_wait_time": self._average_wait_time(),
+                  "driver_total_distance": self._average_total_distance(),
+                  "driver_ride_distance": self._average_ride_distance()}
+        for name, histogram in self.histograms().items():
+            for percentile in PERCENTILES:
+                report[f"{name}_p{percentile}"] = \
+                    float(histogram.quantile(percentile / 100))
+        return report
+
+    def histograms(self) -> Dict[str, Histogram]:
+        """Return the histograms of rider wait time and trip distance, keyed
+        by the name they are reported under.
+
+        The histograms of different runs can be combined with
+        Histogram.merge.
+        """
+        return {"rider_wait_time": self._wait_times,
+                "trip_distance": self._trip_distances}
 
     def _average_wait_time(self) -> float:
         """Return the average wait time of riders that have either been picked
-        up or have cancelled their ride.
+        up or have cancelled their ride, or 0.0 if there are none yet.
 
         """
-        wait_time = 0
-        count = 0
-        for activities in self._activities[RIDER].values():
-            # A rider that has less than two activities hasn't finished
-            # waiting (they haven't cancelled or been picked up).
-            if len(activities) >= 2:
-                # The first activity is REQUEST, and the second is PICKUP
-                # or CANCEL. The wait time is the difference between the two.
-                wait_time += activities[1].time - activities[0].time
-                count += 1
-        return wait_time / count
+        if self._finished_waiting == 0:
+            return 0.0
+        return self._total_wait_time / self._finished_waiting
 
     def _average_total_distance(self) -> float:
-        """Return the average distance drivers have driven.
+        """Return the average distance drivers have driven, or 0.0 if there
+        are no drivers yet.
         """
-        total_distance = 0
-        num_of_drivers = 0
-        for activity_lst in self._activities[DRIVER].values():
-            num_of_drivers += 1
-            if len(activity_lst) >= 2:
-                for j in range(len(activity_lst) - 1):
-                    total_distance += manhattan_distance(
-                        activity_lst[j].location, activity_lst[j + 1].location)
-
-        return total_distance / num_of_drivers
+        if not self._total_distance:
+            return 0.0
+        return sum(self._total_distance.values()) / len(self._total_distance)
 
     def _average_ride_distance(self) -> float:
-        """Return the average distance drivers have driven on rides.
+        """Return the average distance drivers have driven on rides, or 0.0
+        if there are no drivers yet.
         """
-        total_distance = 0
-        num_of_drivers = 0
-        for activity_lst in self._activities[DRIVER].values():
-            num_of_drivers += 1
-            for j in range(len(activity_lst) - 1):
-                if len(activity_lst) >= 2 and \
-                        activity_lst[j].description == PICKUP and \
-                        activity_lst[j + 1].description == DROPOFF:
-                    total_distance += manhattan_distance(
-                        activity_lst[j].location, activity_lst[j + 1].location)
-
-        return total_distance / num_of_drivers
+        if not self._ride_distance:
+            return 0.0
+        return sum(self._ride_distance.values()) / len(self._ride_distance)
 
 
 if __name__ == "__main__":
@@ -165,4 +258,5 @@ if __name__ == "__main__":
     python_ta.check_all(
         config={
             'max-args': 6,
-            'extra-imports': ['typing', 'location']})
+            'extra-imports': ['typing', 'histogram', 'location',
+                              'activity_sink', 'heatmap']})
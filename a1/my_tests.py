@@ -1,10 +1,373 @@
+import gzip
+from collections import deque
+import lzma
 import pytest
 from location import Location, deserialize_location
 from monitor import Monitor
-from dispatcher import Dispatcher
+from dispatcher import Dispatcher, NEAREST
 from simulation import Simulation
 from event import create_event_list, RiderRequest, DriverRequest, Pickup, Dropoff, Cancellation
 from driver import Driver
 from rider import Rider
+from loader import load_events, sort_trace, sorted_events
+from container import PriorityQueue
+from trace_store import convert_trace, TraceStore
+from activity_sink import ActivitySink, read_activities
+from batch_simulation import BatchSimulation
+from telemetry import Telemetry
+from heatmap import Heatmap
+from tick_simulation import TickSimulation, is_dense, simulate
 
 
+
+def test_dispatcher_only_assigns_idle_drivers() -> None:
+    """Test that a driver who is mid-drive is not handed to a new rider"""
+    dispatcher = Dispatcher()
+    near = Driver('Near', Location(1, 1), 1)
+    far = Driver('Far', Location(9, 9), 1)
+    assert dispatcher.request_rider(near) is None
+    assert dispatcher.request_rider(far) is None
+
+    first = Rider('First', 10, Location(1, 2), Location(3, 3))
+    assert dispatcher.request_driver(first) is near
+    near.start_drive(first.origin)
+
+    second = Rider('Second', 10, Location(1, 1), Location(2, 2))
+    assert dispatcher.request_driver(second) is far
+    far.start_drive(second.origin)
+
+    third = Rider('Third', 10, Location(1, 1), Location(2, 2))
+    assert dispatcher.request_driver(third) is None
+
+    near.end_drive()
+    assert dispatcher.request_driver(third) is near
+    assert len({near, far, Driver('Near', Location(0, 0), 2)}) == 2
+
+
+def test_monitor_odometers() -> None:
+    """Test that driver distances are accumulated as activities arrive"""
+    monitor = Monitor()
+    monitor.notify(0, 'driver', 'request', 'Abel', Location(0, 0))
+    monitor.notify(3, 'driver', 'pickup', 'Abel', Location(1, 2))
+    monitor.notify(7, 'driver', 'dropoff', 'Abel', Location(4, 3))
+    monitor.notify(7, 'driver', 'request', 'Abel', Location(4, 3))
+    monitor.notify(0, 'driver', 'request', 'Cain', Location(5, 5))
+    monitor.notify(0, 'rider', 'request', 'Eve', Location(1, 2))
+    monitor.notify(3, 'rider', 'pickup', 'Eve', Location(1, 2))
+    monitor.notify(7, 'rider', 'dropoff', 'Eve', Location(1, 2))
+
+    report = monitor.report()
+    assert report['rider_wait_time'] == pytest.approx(3)
+    assert report['driver_total_distance'] == pytest.approx(3.5)
+    assert report['driver_ride_distance'] == pytest.approx(2)
+
+
+def test_monitor_percentiles() -> None:
+    """Test the wait time and trip distance percentiles in the report"""
+    monitor = Monitor()
+    monitor.notify(0, 'driver', 'request', 'Abel', Location(0, 0))
+    for i in range(100):
+        rider = f'R{i}'
+        monitor.notify(i, 'rider', 'request', rider, Location(0, 0))
+        monitor.notify(2 * i + 1, 'rider', 'pickup', rider, Location(0, 0))
+    report = monitor.report()
+    assert report['rider_wait_time_p50'] == 50
+    assert report['rider_wait_time_p95'] == 95
+    assert report['rider_wait_time_p99'] == 99
+    assert report['trip_distance_p99'] == 0
+
+
+def test_load_events_matches_create_event_list() -> None:
+    """Test that a trace parsed in chunks gives the same simulation"""
+    events = list(load_events("events.txt", 3))
+    assert [event.timestamp for event in events] == \
+        sorted(event.timestamp for event in create_event_list("events.txt"))
+    assert Simulation().run(events) == \
+        Simulation().run(create_event_list("events.txt"))
+
+
+def test_priority_queue_bulk_load_is_fifo_for_ties() -> None:
+    """Test that events with equal timestamps leave in the order they came"""
+    events = [DriverRequest(t, Driver(str(i), Location(0, 0), 1))
+              for i, t in enumerate([3, 1, 3, 1, 2, 3])]
+    for presorted in (False, True):
+        batch = sorted(events, key=lambda e: e.timestamp) if presorted \
+            else events
+        queue = PriorityQueue()
+        queue.add_all(batch)
+        order = [queue.remove().driver.id for _ in batch]
+        assert order == ['1', '3', '4', '0', '2', '5']
+
+
+def test_trace_store_time_range(tmp_path) -> None:
+    """Test reading a time range back from a converted trace"""
+    store_filename = str(tmp_path / "events.bin")
+    assert convert_trace("events.txt", store_filename, 4) == 12
+    with TraceStore(store_filename) as store:
+        events = list(store.events(5, 20))
+        assert [event.timestamp for event in events] == [5, 10, 15]
+        assert events[0].rider.id == 'Bisque'
+        assert str(events[0].rider.destination) == '(2,3)'
+        assert Simulation().run(store.events()) == \
+            Simulation().run(create_event_list("events.txt"))
+
+
+def test_monitor_sink_keeps_only_aggregates(tmp_path) -> None:
+    """Test that a monitor with a sink writes activities to disk instead of
+    keeping them, and still reports the same statistics"""
+    filename = str(tmp_path / "activities.gz")
+    with ActivitySink(filename, batch_size=5) as sink:
+        monitor = Monitor(sink)
+        report = Simulation(monitor).run(create_event_list("events.txt"))
+    assert report == Simulation().run(create_event_list("events.txt"))
+    assert monitor._activities == {'rider': {}, 'driver': {}}
+
+    activities = list(read_activities(filename))
+    assert len(activities) == sink.written
+    category, first = activities[0]
+    assert (category, first.time, first.description, first.id) == \
+        ('driver', 0, 'request', 'Amaranth')
+
+
+def test_dispatcher_nearest_policy() -> None:
+    """Test that a free driver gets the closest waiting rider, and that
+    cancelled riders are no longer handed out"""
+    dispatcher = Dispatcher(NEAREST)
+    riders = [Rider('Old', 10, Location(9, 9), Location(0, 0)),
+              Rider('Near', 10, Location(2, 1), Location(0, 0)),
+              Rider('Nearest', 10, Location(1, 2), Location(0, 0)),
+              Rider('Tied', 10, Location(2, 1), Location(0, 0))]
+    for rider in riders:
+        assert dispatcher.request_driver(rider) is None
+    dispatcher.cancel_ride(riders[2])
+
+    driver = Driver('Abel', Location(1, 1), 1)
+    assert dispatcher.request_rider(driver) is riders[1]
+    driver.start_drive(riders[1].origin)
+    driver.end_drive()
+    assert dispatcher.request_rider(driver) is riders[3]
+    assert dispatcher.request_rider(driver) is riders[0]
+    assert dispatcher.request_rider(driver) is None
+
+
+def test_batch_simulation_matches_simulation() -> None:
+    """Test that every scenario of a batch reports what Simulation does"""
+    def small() -> list:
+        return [DriverRequest(0, Driver('Abel', Location(0, 0), 1)),
+                RiderRequest(1, Rider('Bo', 4, Location(2, 2),
+                                      Location(3, 3))),
+                RiderRequest(1, Rider('Cy', 2, Location(5, 5),
+                                      Location(0, 0)))]
+    expected = [Simulation().run(create_event_list("events.txt")),
+                Simulation().run(small())]
+    batch = BatchSimulation()
+    assert batch.run([create_event_list("events.txt"), small()]) == expected
+    assert batch.steps > 0
+
+
+def test_telemetry_samples_into_bounded_buffer() -> None:
+    """Test that telemetry samples every few events, keeps only the latest
+    samples, and reports each one to its callback"""
+    seen = []
+    telemetry = Telemetry(every=5, capacity=3, callback=seen.append)
+    report = Simulation(telemetry=telemetry).run(
+        create_event_list("events.txt"))
+    assert report == Simulation().run(create_event_list("events.txt"))
+
+    assert len(seen) > 3 and len(telemetry) == 3
+    assert telemetry.samples() == seen[-3:]
+    last = telemetry.latest()
+    assert last.queue_depth == 0 and last.waiting_riders == 0
+    assert all(s.events % 5 == 0 for s in seen[:-1])
+    series = telemetry.series()
+    assert series["events"] == [s.events for s in seen[-3:]]
+    assert series["busy_drivers"][-1] == 0
+
+
+def test_monitor_heatmap_counts_by_cell() -> None:
+    """Test that a monitor's heatmap counts activities in the cell they
+    happen in, growing to cover every cell"""
+    heatmap = Heatmap(cell_size=2)
+    monitor = Monitor(heatmap=heatmap)
+    monitor.notify(0, 'rider', 'request', 'A', Location(5, 5))
+    monitor.notify(1, 'rider', 'request', 'B', Location(4, 4))
+    monitor.notify(2, 'driver', 'request', 'C', Location(-3, 9))
+    assert heatmap.origin() == (-4, 4)
+    demand = heatmap.layer('rider', 'request')
+    assert demand.sum() == 2 and demand[4, 0] == 2
+    assert heatmap.layer('driver', 'request')[0, 2] == 1
+
+    events = create_event_list("events.txt")
+    riders = sum(isinstance(event, RiderRequest) for event in events)
+    heatmap = Heatmap()
+    Simulation(Monitor(heatmap=heatmap)).run(events)
+    layers = heatmap.layers()
+    assert layers['rider_request'].sum() == riders
+    assert layers['rider_pickup'].sum() + layers['rider_cancel'].sum() == \
+        riders
+
+
+def test_compressed_traces_are_read_directly(tmp_path) -> None:
+    """Test that gzip and xz traces load like the plain text trace"""
+    with open("events.txt", "rb") as file:
+        text = file.read()
+    expected = Simulation().run(create_event_list("events.txt"))
+    for module, suffix in ((gzip, ".gz"), (lzma, ".xz")):
+        filename = str(tmp_path / ("events.txt" + suffix))
+        with module.open(filename, "wb") as file:
+            file.write(text)
+        assert Simulation().run(create_event_list(filename)) == expected
+        assert Simulation().run(list(load_events(filename, 2))) == expected
+
+
+def test_simulation_steps_and_resumes() -> None:
+    """Test that stepping, running up to a time and adding events later
+    ends where a single run does"""
+    expected = Simulation().run(create_event_list("events.txt"))
+    events = create_event_list("events.txt")
+    sim = Simulation()
+    sim.add_events([event for event in events if event.timestamp <= 10])
+    assert sim.step(3)['driver_total_distance'] == 0.0
+    partial = sim.run_until(10)
+    assert partial != expected
+    assert sim.run_until(10) == partial
+    sim.add_events([event for event in events if event.timestamp > 10])
+    assert sim.run_until(10 ** 9) == expected
+    assert sim.step() == expected
+
+
+def test_external_sort_keeps_ties_in_file_order(tmp_path) -> None:
+    """Test that sorting a trace in small runs orders it by timestamp with
+    ties in file order, and simulates like the original"""
+    unsorted_filename = str(tmp_path / "unsorted.txt")
+    with open(unsorted_filename, "w") as file:
+        for i, timestamp in enumerate([3, 1, 3, 1, 2, 3, 0]):
+            file.write(f"{timestamp} DriverRequest D{i} 0,0 1\n")
+        file.write("# not an event\n")
+    sorted_filename = str(tmp_path / "sorted.txt")
+    assert sort_trace(unsorted_filename, sorted_filename, run_lines=2) == 7
+    order = [event.driver.id for event in create_event_list(sorted_filename)]
+    assert order == ['D6', 'D1', 'D3', 'D4', 'D0', 'D2', 'D5']
+
+    assert Simulation().run(sorted_events("events.txt", run_lines=3)) == \
+        Simulation().run(create_event_list("events.txt"))
+
+
+def test_tick_simulation_matches_simulation() -> None:
+    """Test that the tick-based engine reports what Simulation does, and is
+    chosen for dense traces only"""
+    expected = Simulation().run(create_event_list("events.txt"))
+    assert TickSimulation().run(create_event_list("events.txt")) == expected
+    assert not is_dense(create_event_list("events.txt"))
+
+    def dense() -> list:
+        return [DriverRequest(0, Driver(f'D{i}', Location(i, 0), 1))
+                for i in range(10)] + \
+               [RiderRequest(0, Rider(f'R{i}', 3, Location(0, i),
+                                      Location(i, i)))
+                for i in range(20)]
+    assert is_dense(dense())
+    assert simulate(dense()) == Simulation().run(dense())
+
+
+def test_simulation_reads_sorted_streams_lazily(tmp_path) -> None:
+    """Test that a run on an iterator of events in timestamp order reads
+    each event only as it is reached, and reports what a run on the list of
+    the same events does, also when spawned events tie with later events
+    of the stream"""
+    filename = str(tmp_path / "ties.txt")
+    with open(filename, "w") as file:
+        for i in range(40):
+            file.write(f"{i % 7} DriverRequest D{i} {i % 5},{i % 3} 1\n")
+            file.write(f"{i % 9} RiderRequest R{i} {i % 4},0 0,{i % 6} "
+                       f"{i % 5 + 1}\n")
+    expected = Simulation().run(create_event_list(filename))
+
+    sim = Simulation()
+    ahead = []
+
+    def stream():
+        for event in sorted_events(filename, run_lines=8):
+            # The event being done and the one after it have been read.
+            ahead.append(len(ahead) - sim._done)
+            yield event
+    assert sim.run(stream()) == expected
+    assert max(ahead) <= 2
+
+    sorted_filename = str(tmp_path / "ties.sorted.txt")
+    sort_trace(filename, sorted_filename)
+    store_filename = str(tmp_path / "ties.bin")
+    convert_trace(sorted_filename, store_filename, 4)
+    with TraceStore(store_filename) as store:
+        assert Simulation().run(store.events()) == expected
+
+    with pytest.raises(ValueError):
+        Simulation().run(iter(create_event_list(filename)))
+
+
+def test_same_time_events_run_as_through_the_queue() -> None:
+    """Test that events spawned with the timestamp of the event that spawned
+    them are done in the order the event queue alone would give: a Dropoff's
+    DriverRequest while a RiderRequest waits at that time, and a Pickup that
+    comes after its rider cancelled"""
+    def trace() -> list:
+        return [DriverRequest(0, Driver('A', Location(0, 0), 1)),
+                RiderRequest(0, Rider('R1', 20, Location(0, 1),
+                                      Location(0, 3))),
+                RiderRequest(1, Rider('R2', 2, Location(9, 9),
+                                      Location(0, 0))),
+                RiderRequest(2, Rider('R8', 1, Location(0, 2),
+                                      Location(0, 0))),
+                RiderRequest(3, Rider('R3', 5, Location(0, 3),
+                                      Location(0, 5))),
+                RiderRequest(3, Rider('R4', 5, Location(0, 4),
+                                      Location(1, 4))),
+                RiderRequest(4, Rider('R5', 5, Location(5, 9),
+                                      Location(5, 0))),
+                DriverRequest(5, Driver('B', Location(5, 5), 1)),
+                RiderRequest(9, Rider('R6', 4, Location(5, 9),
+                                      Location(5, 8))),
+                RiderRequest(11, Rider('R7', 5, Location(0, 4),
+                                       Location(0, 0)))]
+
+    class Log(Monitor):
+        """A Monitor that also keeps every activity in the order done"""
+        def __init__(self) -> None:
+            super().__init__()
+            self.log = []
+
+        def notify(self, timestamp, category, description, identifier,
+                   location) -> None:
+            super().notify(timestamp, category, description, identifier,
+                           location)
+            self.log.append((timestamp, category, description, identifier,
+                             str(location)))
+
+    class SameTime(deque):
+        """The same-time events of <sim>, which are recorded, and are put
+        in its event queue instead if <queued>"""
+        def __init__(self, sim: Simulation, queued: bool) -> None:
+            super().__init__()
+            self.sim, self.queued, self.spawned = sim, queued, []
+
+        def append(self, event) -> None:
+            self.spawned.append((event.timestamp, type(event).__name__,
+                                 event.driver.id))
+            if self.queued:
+                self.sim._events.add(event)
+            else:
+                super().append(event)
+
+    runs = []
+    for queued in (False, True):
+        monitor = Log()
+        sim = Simulation(monitor)
+        sim._same_time = SameTime(sim, queued)
+        runs.append((sim.run(trace()), monitor.log, sim._same_time.spawned))
+    assert runs[0] == runs[1]
+    spawned = runs[0][2]
+    # A drops R1 off at 3 while R3 and R4 wait, and is sent to R3 at once,
+    # after R8 cancels at 3.
+    assert spawned[:2] == [(3, 'DriverRequest', 'A'), (3, 'Pickup', 'A')]
+    # B reaches R4 at 11, after R4 cancelled, while R7 waits there.
+    assert (11, 'DriverRequest', 'B') in spawned
@@ -45,7 +45,7 @@ def test_simulation_run() -> None:
     assert len(events) == 12
     sim = Simulation()
     report = sim.run(events)
-    assert len(report) == 3
+    assert len(report) == 9
     assert report['rider_wait_time'] == pytest.approx(0.5)
     assert report['driver_total_distance'] == pytest.approx(4.5)
     assert report['driver_ride_distance'] == pytest.approx(3.8333333333333335)
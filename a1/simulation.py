@@ -1,10 +1,12 @@
 """Starting point for simulation"""
 
-from typing import List, Dict
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional
 from container import PriorityQueue
 from dispatcher import Dispatcher
 from event import Event, create_event_list
 from monitor import Monitor
+from telemetry import Telemetry
 
 
 class Simulation:
@@ -23,6 +25,10 @@ class Simulation:
     This is the entry point into your program, and in particular is used for
     auto-testing purposes. This makes it ESSENTIAL that you do not change the
     interface in any way!
+
+    Besides run, a simulation can be advanced a few events at a time, or up
+    to a timestamp, with more events added between steps; each step picks up
+    exactly where the last one stopped.
     """
 
     # === Private Attributes ===
@@ -33,14 +39,43 @@ class Simulation:
     #     The dispatcher associated with the simulation.
     _monitor: Monitor
     #     The monitor associated with the simulation.
-
-    def __init__(self) -> None:
-        """Initialize a Simulation.
+    _same_time: deque
+    #     Events spawned with the same timestamp as the event that spawned
+    #     them, in the order they were spawned. They are run straight after
+    #     the events in _events that share their timestamp, which is where
+    #     _events would have put them, without going through _events.
+    _stream: Iterator[Event]
+    #     The rest of the events in timestamp order given to run as an
+    #     iterator, which are read one at a time as the simulation reaches
+    #     them instead of going through _events.
+    _head: Optional[Event]
+    #     The next event of _stream, read but not yet done, or None if
+    #     _stream is used up.
+    _telemetry: Optional[Telemetry]
+    #     The telemetry that samples the simulation as it runs, if any.
+    _done: int
+    #     The number of events done so far.
+    _time: int
+    #     The timestamp of the last event done, or 0 before the first.
+
+    def __init__(self, monitor: Optional[Monitor] = None,
+                 dispatcher: Optional[Dispatcher] = None,
+                 telemetry: Optional[Telemetry] = None) -> None:
+        """Initialize a Simulation that reports its activities to <monitor>
+        and matches riders and drivers with <dispatcher>. A new Monitor or
+        Dispatcher is used for any that is not given. If <telemetry> is
+        given, it samples the simulation while it runs.
 
         """
         self._events = PriorityQueue()
-        self._dispatcher = Dispatcher()
-        self._monitor = Monitor()
+        self._dispatcher = Dispatcher() if dispatcher is None else dispatcher
+        self._monitor = Monitor() if monitor is None else monitor
+        self._same_time = deque()
+        self._stream = iter(())
+        self._head = None
+        self._telemetry = telemetry
+        self._done = 0
+        self._time = 0
 
     def run(self, initial_events: List[Event]) -> Dict[str, float]:
         """Run the simulation on the list of events in <initial_events>.
@@ -48,29 +83,140 @@ class Simulation:
         Return a dictionary containing statistics of the simulation,
         according to the specifications in the assignment handout.
 
+        <initial_events> may instead be an iterator over events in timestamp
+        order, such as sorted_events or TraceStore.events returns. It is then
+        read one event at a time as the simulation reaches it, so the whole
+        trace is never in memory at once, and the report is the one that
+        the list of the same events would give. ValueError is raised if an
+        event in it is earlier than the one before it.
+
         initial_events: An initial list of events.
         """
-        for event in initial_events:
-            self._events.add(event)
+        if isinstance(initial_events, list):
+            self.add_events(initial_events)
+        else:
+            self._stream = iter(initial_events)
+            self._read_stream()
+        self._advance(None, None)
+        return self._monitor.report()
+
+    def add_events(self, events: Iterable[Event]) -> None:
+        """Add <events> to the events still to be done, after any pending
+        events with the same timestamp.
+
+        Precondition: no event in <events> is earlier than the last event
+        done.
+        """
+        # The same-time events were spawned before <events> were added, so
+        # they join the queue first; the queue then orders everything.
+        while self._same_time:
+            self._events.add(self._same_time.popleft())
+        self._events.add_all(events)
 
-        while not self._events.is_empty():
-            todo_event = self._events.remove()
+    def step(self, n: int = 1) -> Dict[str, float]:
+        """Do the next <n> events, or as many as are left, and return a
+        report of everything done so far.
+
+        """
+        self._advance(n, None)
+        return self._monitor.report()
+
+    def run_until(self, timestamp: int) -> Dict[str, float]:
+        """Do every event up to and including <timestamp>, and return a report
+        of everything done so far.
+
+        Events can be added with add_events and the run continued from
+        where it stopped.
+        """
+        self._advance(None, timestamp)
+        return self._monitor.report()
+
+    def _advance(self, limit: Optional[int], until: Optional[int]) -> None:
+        """Do at most <limit> events, stopping before any event later than
+        <until>. A bound that is None does not restrict the run.
+
+        """
+        telemetry = self._telemetry
+        if telemetry is not None and self._done == 0:
+            telemetry.start()
+        stop = None if limit is None else self._done + limit
+
+        while stop is None or self._done < stop:
+            todo_event = self._next_event(until)
+            if todo_event is None:
+                break
+            self._done += 1
+            self._time = todo_event.timestamp
             returned_events = todo_event.do(self._dispatcher, self._monitor)
             lst = []
             for event_ in returned_events:
                 if event_ not in lst:
-                    self._events.add(event_)
+                    if event_.timestamp == todo_event.timestamp:
+                        self._same_time.append(event_)
+                    else:
+                        self._events.add(event_)
                     lst.append(event_)
+            if telemetry is not None and self._done % telemetry.every == 0:
+                self._sample()
 
-        return self._monitor.report()
+        if telemetry is not None and self._done % telemetry.every != 0 \
+                and self._events.is_empty() and not self._same_time \
+                and self._head is None:
+            self._sample()
+
+    def _sample(self) -> None:
+        """Have the telemetry sample the simulation.
+
+        """
+        self._telemetry.sample(self._time, self._done,
+                               len(self._events) + len(self._same_time)
+                               + (self._head is not None),
+                               self._dispatcher)
+
+    def _read_stream(self) -> None:
+        """Read the next event of _stream into _head, or set _head to None if
+        _stream is used up.
+
+        """
+        event = next(self._stream, None)
+        if event is not None and self._head is not None \
+                and event < self._head:
+            raise ValueError(f"event at {event.timestamp} given to run after "
+                             f"one at {self._head.timestamp}")
+        self._head = event
+
+    def _next_event(self, until: Optional[int] = None) -> Optional[Event]:
+        """Remove and return the event that should be done next, or return
+        None if no event is left or the next is later than <until>.
+
+        """
+        # The events of _stream were given before any other event was added
+        # or spawned, so they go first among the events with their timestamp.
+        head = self._head
+        if head is not None and (until is None or head.timestamp <= until) \
+                and not (self._same_time and self._same_time[0] < head) \
+                and (self._events.is_empty() or head <= self._events.peek()):
+            self._read_stream()
+            return head
+        # Every event in _same_time has the current timestamp, and was
+        # spawned after any event in _events with that timestamp was added.
+        if self._same_time and (
+                self._events.is_empty()
+                or self._same_time[0] < self._events.peek()):
+            return self._same_time.popleft()
+        if self._events.is_empty() or (
+                until is not None and self._events.peek().timestamp > until):
+            return None
+        return self._events.remove()
 
 
 if __name__ == "__main__":
     import python_ta
     python_ta.check_all(
         config={
-            'extra-imports': ['typing', 'container', 'dispatcher', 'event',
-                              'monitor']})
+            'extra-imports': ['collections', 'typing', 'container',
+                              'dispatcher', 'event', 'monitor',
+                              'telemetry']})
 
     events = create_event_list("events.txt")
     sim = Simulation()
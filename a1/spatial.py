@@ -0,0 +1,150 @@
+"""A spatial index for finding the nearest location in the simulation"""
+
+from typing import Dict, Hashable, Optional, Set, Tuple
+from location import Location, manhattan_distance
+
+
+class GridIndex:
+    """An index of keyed locations that finds the key whose location is
+    closest, by Manhattan distance, to a given location.
+
+    The grid is divided into square cells of <cell_size> by <cell_size>
+    blocks, and each key is filed under the cell its location is in. A
+    nearest-key query searches outward from the query's cell, one ring of
+    cells at a time, and stops as soon as no unsearched cell can hold a
+    closer location. Adding and removing keys takes constant time.
+
+    Among keys at the same distance, the one that was added first is chosen.
+
+    === Attributes ===
+    cell_size: The width and height of a cell, in blocks.
+    """
+    # === Private Attributes ===
+    # _cells: the entries filed under each non-empty cell, keyed by the
+    #     cell's (row, column). Each entry maps a key to its location and
+    #     the number of keys added before it.
+    # _where: the cell each key is filed under.
+    # _added: the number of keys ever added.
+
+    cell_size: int
+    _cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[Location, int]]]
+    _where: Dict[Hashable, Tuple[int, int]]
+    _added: int
+
+    def __init__(self, cell_size: int = 4) -> None:
+        """Initialize an empty GridIndex.
+
+        """
+        self.cell_size = cell_size
+        self._cells = {}
+        self._where = {}
+        self._added = 0
+
+    def __len__(self) -> int:
+        """Return the number of keys in this GridIndex.
+
+        """
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Return True iff <key> is in this GridIndex.
+
+        """
+        return key in self._where
+
+    def _cell(self, location: Location) -> Tuple[int, int]:
+        """Return the cell that <location> is in.
+
+        """
+        row, col = location.location
+        return row // self.cell_size, col // self.cell_size
+
+    def add(self, key: Hashable, location: Location) -> None:
+        """Add <key> at <location>.
+
+        Precondition: key is not in this GridIndex.
+        """
+        cell = self._cell(location)
+        self._cells.setdefault(cell, {})[key] = (location, self._added)
+        self._where[key] = cell
+        self._added += 1
+
+    def remove(self, key: Hashable) -> None:
+        """Remove <key>, if it is in this GridIndex.
+
+        """
+        cell = self._where.pop(key, None)
+        if cell is not None:
+            entries = self._cells[cell]
+            del entries[key]
+            if not entries:
+                del self._cells[cell]
+
+    def nearest(self, location: Location) -> Optional[Hashable]:
+        """Return the key closest to <location>, or None if this GridIndex is
+        empty.
+
+        >>> index = GridIndex(2)
+        >>> index.add('far', Location(9, 9))
+        >>> index.add('near', Location(2, 3))
+        >>> index.add('also near', Location(3, 2))
+        >>> index.nearest(Location(1, 1))
+        'near'
+        """
+        if not self._where:
+            return None
+        centre_row, centre_col = self._cell(location)
+        best = (float('inf'), 0, None)
+        searched = 0
+        radius = 0
+        # Any location in a cell <radius> rings away is at least
+        # (radius - 1) * cell_size + 1 blocks away, so once the best
+        # distance is within (radius - 1) * cell_size, no ring from <radius>
+        # outwards can hold a closer key.
+        while best[0] > (radius - 1) * self.cell_size:
+            ring = _ring(centre_row, centre_col, radius)
+            searched += len(ring)
+            if searched > len(self._cells):
+                # Walking empty rings would cost more than looking at every
+                # non-empty cell, so do that instead.
+                return self._nearest_in(set(self._cells), location, best)[2]
+            best = self._nearest_in(ring, location, best)
+            radius += 1
+        return best[2]
+
+    def _nearest_in(self, cells: Set[Tuple[int, int]], location: Location,
+                    best: Tuple[float, int, Optional[Hashable]]) \
+            -> Tuple[float, int, Optional[Hashable]]:
+        """Return the (distance, order, key) of the closest key filed under
+        <cells>, or <best> if none of them is closer.
+
+        """
+        for cell in cells:
+            for key, (other, order) in self._cells.get(cell, {}).items():
+                candidate = (manhattan_distance(location, other), order, key)
+                if candidate[:2] < best[:2]:
+                    best = candidate
+        return best
+
+
+def _ring(row: int, col: int, radius: int) -> Set[Tuple[int, int]]:
+    """Return the cells that are exactly <radius> cells away from the cell
+    (row, col), counting diagonal steps as one.
+
+    >>> sorted(_ring(0, 0, 1))
+    [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+    """
+    if radius == 0:
+        return {(row, col)}
+    cells = set()
+    for offset in range(-radius, radius + 1):
+        cells.add((row - radius, col + offset))
+        cells.add((row + radius, col + offset))
+        cells.add((row + offset, col - radius))
+        cells.add((row + offset, col + radius))
+    return cells
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['typing', 'location']})
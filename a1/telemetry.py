@@ -0,0 +1,168 @@
+"""Sampling the state of a running simulation
+
+A Telemetry is handed to a Simulation and takes a Sample every <every> events:
+how many events are pending, how many riders are waiting, how many drivers
+are idle and busy, and how fast events are being done. The most recent
+samples are kept in a ring buffer of fixed size, so a run of any length uses
+the same memory, and can be exported as a time series.
+"""
+
+from __future__ import annotations
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+from dispatcher import Dispatcher
+
+# The fields of a Sample, in the order they are exported.
+_FIELDS = ("time", "events", "queue_depth", "waiting_riders", "idle_drivers",
+           "busy_drivers", "events_per_second")
+
+
+class Sample:
+    """The state of a simulation after some number of events.
+
+    === Attributes ===
+    time: The timestamp of the last event done.
+    events: The number of events done so far.
+    queue_depth: The number of events waiting to be done.
+    waiting_riders: The number of riders on the dispatcher's waiting list.
+    idle_drivers: The number of registered drivers that are not driving.
+    busy_drivers: The number of registered drivers that are driving.
+    events_per_second: The number of events done per second of wall-clock
+        time since the previous sample.
+    """
+
+    time: int
+    events: int
+    queue_depth: int
+    waiting_riders: int
+    idle_drivers: int
+    busy_drivers: int
+    events_per_second: float
+
+    def __init__(self, timestamp: int, events: int, queue_depth: int,
+                 dispatcher: Dispatcher, events_per_second: float) -> None:
+        """Initialize a Sample, reading the rider and driver counts from
+        <dispatcher>.
+
+        """
+        self.time = timestamp
+        self.events = events
+        self.queue_depth = queue_depth
+        self.waiting_riders = dispatcher.waiting_count()
+        self.idle_drivers = dispatcher.idle_count()
+        self.busy_drivers = dispatcher.busy_count()
+        self.events_per_second = events_per_second
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return f"time: {self.time}, events: {self.events}, " \
+               f"queue depth: {self.queue_depth}, " \
+               f"waiting riders: {self.waiting_riders}, " \
+               f"idle drivers: {self.idle_drivers}, " \
+               f"busy drivers: {self.busy_drivers}, " \
+               f"events/sec: {self.events_per_second:.0f}"
+
+
+class Telemetry:
+    """A bounded record of samples taken while a simulation runs.
+
+    === Attributes ===
+    every: The number of events done between two samples.
+    callback: A function that is called with each new sample, e.g. to report
+        progress, or None.
+    """
+    # === Private Attributes ===
+    # _samples: the most recent samples, oldest first.
+    # _last_events: the number of events done at the previous sample.
+    # _last_clock: the wall-clock time of the previous sample.
+
+    every: int
+    callback: Optional[Callable[[Sample], None]]
+    _samples: Deque[Sample]
+    _last_events: int
+    _last_clock: float
+
+    def __init__(self, every: int = 1000, capacity: int = 1024,
+                 callback: Optional[Callable[[Sample], None]] = None) -> None:
+        """Initialize a Telemetry that samples every <every> events and keeps
+        the last <capacity> samples.
+
+        Precondition: every >= 1 and capacity >= 1
+        """
+        self.every = every
+        self.callback = callback
+        self._samples = deque(maxlen=capacity)
+        self.start()
+
+    def __len__(self) -> int:
+        """Return the number of samples kept.
+
+        """
+        return len(self._samples)
+
+    def start(self) -> None:
+        """Start timing a new run.
+
+        The samples of earlier runs are kept.
+        """
+        self._last_events = 0
+        self._last_clock = time.perf_counter()
+
+    def sample(self, timestamp: int, events: int, queue_depth: int,
+               dispatcher: Dispatcher) -> Sample:
+        """Take, keep and return a sample of a run that has done <events>
+        events, the last at <timestamp>, and has <queue_depth> events left.
+
+        """
+        clock = time.perf_counter()
+        elapsed = clock - self._last_clock
+        rate = (events - self._last_events) / elapsed if elapsed > 0 else 0.0
+        self._last_events, self._last_clock = events, clock
+
+        sample = Sample(timestamp, events, queue_depth, dispatcher, rate)
+        self._samples.append(sample)
+        if self.callback is not None:
+            self.callback(sample)
+        return sample
+
+    def latest(self) -> Optional[Sample]:
+        """Return the most recent sample, or None if there is none.
+
+        """
+        return self._samples[-1] if self._samples else None
+
+    def samples(self) -> List[Sample]:
+        """Return the samples kept, oldest first.
+
+        """
+        return list(self._samples)
+
+    def series(self) -> Dict[str, List[float]]:
+        """Return the samples kept as a time series: a list of values for
+        each field of Sample, oldest first.
+
+        """
+        return {field: [getattr(sample, field) for sample in self._samples]
+                for field in _FIELDS}
+
+    def write_csv(self, filename: str) -> None:
+        """Write the samples kept to <filename>, one line per sample, with a
+        header line naming the fields.
+
+        """
+        with open(filename, "w") as file:
+            file.write(",".join(_FIELDS) + "\n")
+            for sample in self._samples:
+                file.write(",".join(str(getattr(sample, field))
+                                    for field in _FIELDS) + "\n")
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['Telemetry.write_csv'],
+            'extra-imports': ['time', 'collections', 'typing', 'dispatcher']})
@@ -0,0 +1,363 @@
+"""A tick-based engine for dense simulations
+
+When a trace has many events at nearly every timestamp, most of the time of
+Simulation.run goes into creating and ordering event objects and into the
+dispatcher's search of every idle driver in Python. A TickSimulation keeps
+the state of every driver and rider in arrays instead, files pending events
+in one bucket per tick of simulated time, and walks the ticks in order. The
+closest idle driver for a rider is found with one vectorized pass over the
+driver arrays.
+
+Within a tick, events are done in the order Simulation would do them, so a
+TickSimulation reports exactly what Simulation.run with the default
+Dispatcher and Monitor does.
+
+=== Constants ===
+DENSE_EVENTS_PER_TICK: The average number of initial events per distinct
+    timestamp from which simulate chooses a TickSimulation.
+"""
+
+import heapq
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+import numpy as np
+from batch_simulation import RIDER_REQUEST, DRIVER_REQUEST, CANCELLATION, \
+    PICKUP, DROPOFF
+from event import Event, DriverRequest, RiderRequest
+from histogram import Histogram
+from monitor import PERCENTILES
+from simulation import Simulation
+
+DENSE_EVENTS_PER_TICK = 8
+
+# Rider statuses, as stored in the rider arrays.
+_WAITING = 0
+_CANCELLED = 1
+_SATISFIED = 2
+
+
+class TickSimulation:
+    """A simulation of one scenario whose state is kept in arrays and whose
+    events are done tick by tick.
+
+    === Attributes ===
+    ticks: The number of ticks with events in the last run.
+    """
+    # === Private Attributes ===
+    # Drivers and riders are numbered in the order they first appear in
+    # the initial events.
+    #
+    # _d_row, _d_col: each driver's location.
+    # _d_speed: each driver's speed.
+    # _d_free: whether each driver is registered and not driving; the
+    #     drivers a rider request is matched against.
+    # _d_order: the order in which each driver registered.
+    # _d_dest: each driver's destination, while driving.
+    # _d_idle, _d_registered: whether each driver is idle, and registered.
+    # _d_last: the location of each driver's last activity, or None before
+    #     the first.
+    # _d_last_pickup: whether each driver's last activity was a pickup.
+    # _registered: the number of drivers that have registered.
+    #
+    # _r_origin, _r_destination: each rider's origin and destination.
+    # _r_patience: each rider's patience.
+    # _r_status: one of _WAITING, _CANCELLED or _SATISFIED.
+    # _r_since: when each rider who is still being timed requested a ride.
+    # _waiting: the riders on the dispatcher's waiting list, oldest first.
+    #
+    # _calendar: the pending events of each tick, in the order they are to
+    #     be done, as (kind, rider, driver) triples.
+    # _ticks: a heap of the ticks that have a bucket in _calendar.
+    #
+    # _wait_total, _waits: the sum and histogram of finished waits.
+    # _total_distance, _ride_distance: the distance driven by all drivers,
+    #     and driven with a rider.
+    # _trips: the histogram of trip distances.
+
+    ticks: int
+    _d_row: np.ndarray
+    _d_col: np.ndarray
+    _d_speed: np.ndarray
+    _d_free: np.ndarray
+    _d_order: np.ndarray
+    _d_dest: List[Tuple[int, int]]
+    _d_idle: List[bool]
+    _d_registered: List[bool]
+    _d_last: List[Tuple[int, int]]
+    _d_last_pickup: List[bool]
+    _registered: int
+    _r_origin: List[Tuple[int, int]]
+    _r_destination: List[Tuple[int, int]]
+    _r_patience: List[int]
+    _r_status: List[int]
+    _r_since: Dict[int, int]
+    _waiting: OrderedDict
+    _calendar: Dict[int, List[Tuple[int, int, int]]]
+    _ticks: List[int]
+    _wait_total: int
+    _waits: Histogram
+    _total_distance: int
+    _ride_distance: int
+    _trips: Histogram
+
+    def __init__(self) -> None:
+        """Initialize a TickSimulation.
+
+        """
+        self.ticks = 0
+
+    def run(self, initial_events: List[Event]) -> Dict[str, float]:
+        """Run the simulation on the list of events in <initial_events> and
+        return the report Simulation.run would.
+
+        Precondition: every initial event is a DriverRequest or a
+        RiderRequest, and ids are unique.
+        """
+        self._load(initial_events)
+        self.ticks = 0
+        while self._ticks:
+            tick = heapq.heappop(self._ticks)
+            bucket = self._calendar[tick]
+            # Events spawned for this tick while it is being done are
+            # appended to the bucket, after every event already in it.
+            i = 0
+            while i < len(bucket):
+                self._do(tick, *bucket[i])
+                i += 1
+            del self._calendar[tick]
+            self.ticks += 1
+        return self._report()
+
+    def _load(self, initial_events: List[Event]) -> None:
+        """Create the state of the drivers and riders of <initial_events> and
+        schedule those events.
+
+        """
+        drivers = [e.driver for e in initial_events
+                   if isinstance(e, DriverRequest)]
+        riders = [e.rider for e in initial_events
+                  if isinstance(e, RiderRequest)]
+        driver_index = {driver.id: d for d, driver in enumerate(drivers)}
+        rider_index = {rider.id: r for r, rider in enumerate(riders)}
+
+        self._d_row = np.array([d.location.location[0] for d in drivers],
+                               dtype=np.int64)
+        self._d_col = np.array([d.location.location[1] for d in drivers],
+                               dtype=np.int64)
+        self._d_speed = np.array([d.speed for d in drivers], dtype=np.float64)
+        self._d_free = np.zeros(len(drivers), dtype=bool)
+        self._d_order = np.zeros(len(drivers), dtype=np.int64)
+        self._d_dest = [(0, 0)] * len(drivers)
+        self._d_idle = [True] * len(drivers)
+        self._d_registered = [False] * len(drivers)
+        self._d_last = [None] * len(drivers)
+        self._d_last_pickup = [False] * len(drivers)
+        self._registered = 0
+
+        self._r_origin = [r.origin.location for r in riders]
+        self._r_destination = [r.destination.location for r in riders]
+        self._r_patience = [r.patience for r in riders]
+        self._r_status = [_WAITING] * len(riders)
+        self._r_since = {}
+        self._waiting = OrderedDict()
+
+        self._calendar = {}
+        self._ticks = []
+        self._wait_total = 0
+        self._waits = Histogram()
+        self._total_distance = 0
+        self._ride_distance = 0
+        self._trips = Histogram()
+
+        for event in initial_events:
+            if isinstance(event, DriverRequest):
+                self._schedule(event.timestamp, DRIVER_REQUEST, 0,
+                               driver_index[event.driver.id])
+            else:
+                self._schedule(event.timestamp, RIDER_REQUEST,
+                               rider_index[event.rider.id], 0)
+
+    def _schedule(self, tick: int, kind: int, rider: int,
+                  driver: int) -> None:
+        """Schedule an event of <kind> for <rider> and <driver> at <tick>,
+        after every event already scheduled then.
+
+        """
+        bucket = self._calendar.get(tick)
+        if bucket is None:
+            bucket = self._calendar[tick] = []
+            heapq.heappush(self._ticks, tick)
+        bucket.append((kind, rider, driver))
+
+    def _do(self, tick: int, kind: int, rider: int, driver: int) -> None:
+        """Do the event of <kind> for <rider> and <driver> at <tick>.
+
+        """
+        if kind == RIDER_REQUEST:
+            self._do_rider_request(tick, rider)
+        elif kind == DRIVER_REQUEST:
+            self._do_driver_request(tick, driver)
+        elif kind == CANCELLATION:
+            if self._r_status[rider] == _WAITING:
+                self._r_status[rider] = _CANCELLED
+                self._waiting.pop(rider, None)
+                self._end_wait(tick, rider)
+        elif kind == PICKUP:
+            self._do_pickup(tick, rider, driver)
+        else:
+            self._end_drive(driver)
+            self._notify_driver(driver, self._d_dest[driver], DROPOFF)
+            self._schedule(tick, DRIVER_REQUEST, rider, driver)
+
+    def _do_rider_request(self, tick: int, rider: int) -> None:
+        """Give <rider> the closest free driver, ties going to the one that
+        registered first, or put them on the waiting list.
+
+        """
+        self._r_since[rider] = tick
+        cancel_tick = tick + self._r_patience[rider]
+        free = self._d_free
+        if not free.any():
+            self._waiting[rider] = None
+            self._schedule(cancel_tick, CANCELLATION, rider, 0)
+            return
+
+        row, col = self._r_origin[rider]
+        travel = np.rint((np.abs(self._d_row - row) + np.abs(self._d_col - col))
+                         / self._d_speed)
+        travel[~free] = np.inf
+        closest = np.flatnonzero(travel == travel.min())
+        driver = int(closest[np.argmin(self._d_order[closest])])
+
+        pickup_tick = tick + self._start_drive(driver, (row, col))
+        self._schedule(pickup_tick, PICKUP, rider, driver)
+        # Simulation drops a spawned event that has the same timestamp as
+        # one spawned before it by the same event.
+        if cancel_tick != pickup_tick:
+            self._schedule(cancel_tick, CANCELLATION, rider, 0)
+
+    def _do_driver_request(self, tick: int, driver: int) -> None:
+        """Register <driver> if they are new, and give them the rider who has
+        waited longest if they are idle.
+
+        """
+        location = int(self._d_row[driver]), int(self._d_col[driver])
+        self._notify_driver(driver, location, DRIVER_REQUEST)
+        if not self._d_registered[driver]:
+            self._d_registered[driver] = True
+            self._d_order[driver] = self._registered
+            self._registered += 1
+            self._d_free[driver] = self._d_idle[driver]
+        if self._d_idle[driver] and self._waiting:
+            rider = self._waiting.popitem(last=False)[0]
+            travel = self._start_drive(driver, self._r_origin[rider])
+            self._schedule(tick + travel, PICKUP, rider, driver)
+
+    def _do_pickup(self, tick: int, rider: int, driver: int) -> None:
+        """Have <driver> pick up <rider>, unless <rider> has cancelled.
+
+        """
+        self._end_drive(driver)
+        if self._r_status[rider] == _CANCELLED:
+            self._schedule(tick, DRIVER_REQUEST, rider, driver)
+            return
+        ride = self._start_drive(driver, self._r_destination[rider])
+        self._r_status[rider] = _SATISFIED
+        self._notify_driver(driver, self._r_origin[rider], PICKUP)
+        self._end_wait(tick, rider)
+        self._schedule(tick + ride, DROPOFF, rider, driver)
+
+    def _start_drive(self, driver: int, destination: Tuple[int, int]) -> int:
+        """Start <driver> driving to <destination> and return the time the
+        drive will take.
+
+        """
+        self._d_dest[driver] = destination
+        self._d_idle[driver] = False
+        self._d_free[driver] = False
+        distance = abs(int(self._d_row[driver]) - destination[0]) + \
+            abs(int(self._d_col[driver]) - destination[1])
+        return int(round(distance / self._d_speed[driver]))
+
+    def _end_drive(self, driver: int) -> None:
+        """Move <driver> to their destination and make them idle.
+
+        """
+        self._d_row[driver], self._d_col[driver] = self._d_dest[driver]
+        self._d_idle[driver] = True
+        self._d_free[driver] = self._d_registered[driver]
+
+    def _notify_driver(self, driver: int, location: Tuple[int, int],
+                       kind: int) -> None:
+        """Advance the odometers of <driver> for an activity of <kind> at
+        <location>, as Monitor.notify does.
+
+        """
+        last = self._d_last[driver]
+        if last is not None:
+            distance = abs(last[0] - location[0]) + abs(last[1] - location[1])
+            self._total_distance += distance
+            if kind == DROPOFF and self._d_last_pickup[driver]:
+                self._ride_distance += distance
+                self._trips.record(distance)
+        self._d_last[driver] = location
+        self._d_last_pickup[driver] = kind == PICKUP
+
+    def _end_wait(self, tick: int, rider: int) -> None:
+        """Record the end of the wait of <rider>, if it is still being
+        timed.
+
+        """
+        since = self._r_since.pop(rider, None)
+        if since is not None:
+            wait = tick - since
+            self._wait_total += wait
+            self._waits.record(wait)
+
+    def _report(self) -> Dict[str, float]:
+        """Return the report of the run, as Monitor.report would.
+
+        """
+        drivers = sum(last is not None for last in self._d_last)
+        report = {
+            "rider_wait_time": self._wait_total / self._waits.count
+            if self._waits.count else 0.0,
+            "driver_total_distance": self._total_distance / drivers
+            if drivers else 0.0,
+            "driver_ride_distance": self._ride_distance / drivers
+            if drivers else 0.0}
+        for name, histogram in (("rider_wait_time", self._waits),
+                                ("trip_distance", self._trips)):
+            for percentile in PERCENTILES:
+                report[f"{name}_p{percentile}"] = \
+                    float(histogram.quantile(percentile / 100))
+        return report
+
+
+def is_dense(initial_events: List[Event]) -> bool:
+    """Return True iff <initial_events> has at least DENSE_EVENTS_PER_TICK
+    events per distinct timestamp, on average.
+
+    """
+    timestamps = {event.timestamp for event in initial_events}
+    return len(initial_events) >= DENSE_EVENTS_PER_TICK * len(timestamps) > 0
+
+
+def simulate(initial_events: List[Event]) -> Dict[str, float]:
+    """Run the simulation on <initial_events> with the engine that suits
+    their density, and return its report.
+
+    The report is the same whichever engine is chosen.
+    """
+    if is_dense(initial_events):
+        return TickSimulation().run(initial_events)
+    return Simulation().run(initial_events)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'extra-imports': ['heapq', 'collections', 'typing', 'numpy',
+                              'batch_simulation', 'event', 'histogram',
+                              'monitor', 'simulation']})
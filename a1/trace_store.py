@@ -0,0 +1,241 @@
+"""A binary, time-indexed store for event traces
+
+convert_trace turns an events file into a file of fixed-size binary records,
+one per event, followed by a sparse index holding the timestamp of every
+<index_every>-th record. A TraceStore memory-maps such a file, so it can jump
+straight to the first event of a time range and read records in place instead
+of parsing the trace from the start.
+
+=== Constants ===
+MAGIC: The bytes that every trace store file starts with.
+HEADER: The layout of the file header: the magic bytes, the width of the id
+    field, the number of records between index entries, the number of
+    records, and the offset of the index.
+DRIVER_REQUEST: The record kind for a DriverRequest event.
+RIDER_REQUEST: The record kind for a RiderRequest event.
+"""
+
+from __future__ import annotations
+import mmap
+import struct
+from typing import BinaryIO, Iterator, Optional
+from compression import open_trace
+from driver import Driver
+from event import Event, DriverRequest, RiderRequest, parse_event
+from location import Location
+from rider import Rider
+
+MAGIC = b"EVTSTORE"
+HEADER = struct.Struct("<8sIIQQ")
+INDEX_ENTRY = struct.Struct("<q")
+
+DRIVER_REQUEST = 0
+RIDER_REQUEST = 1
+
+
+def _record_struct(id_width: int) -> struct.Struct:
+    """Return the layout of one record: timestamp, kind, location,
+    destination, speed or patience, and the id padded to <id_width> bytes.
+
+    A DriverRequest has no destination; its destination fields are 0.
+    """
+    return struct.Struct(f"<qBiiiii{id_width}s")
+
+
+def convert_trace(filename: str, store_filename: str,
+                  index_every: int = 1024) -> int:
+    """Write the events in the events file <filename> to a new trace store
+    <store_filename>, and return the number of events written.
+
+    Every <index_every>-th event is entered in the time index.
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout, possibly compressed, and its events are in
+    timestamp order.
+    """
+    # The first pass finds the widest id, so that every record can have
+    # the same size, and checks that the trace is sorted.
+    id_width = 1
+    count = 0
+    last_timestamp = None
+    with open_trace(filename) as file:
+        for line in file:
+            event = parse_event(line)
+            if event is None:
+                continue
+            if last_timestamp is not None and event.timestamp < last_timestamp:
+                raise ValueError(f"{filename} is not in timestamp order")
+            last_timestamp = event.timestamp
+            id_width = max(id_width, len(_event_id(event).encode()))
+            count += 1
+
+    record = _record_struct(id_width)
+    index_offset = HEADER.size + count * record.size
+    with open_trace(filename) as file, open(store_filename, "wb") as store:
+        store.write(HEADER.pack(MAGIC, id_width, index_every, count,
+                                index_offset))
+        index = []
+        written = 0
+        for line in file:
+            event = parse_event(line)
+            if event is None:
+                continue
+            if written % index_every == 0:
+                index.append(INDEX_ENTRY.pack(event.timestamp))
+            store.write(_pack_event(record, event))
+            written += 1
+        store.write(b"".join(index))
+    return count
+
+
+def _event_id(event: Event) -> str:
+    """Return the id of the driver or rider making the request <event>.
+
+    """
+    if isinstance(event, DriverRequest):
+        return event.driver.id
+    return event.rider.id
+
+
+def _pack_event(record: struct.Struct, event: Event) -> bytes:
+    """Return the binary record for the request <event>.
+
+    """
+    if isinstance(event, DriverRequest):
+        driver = event.driver
+        return record.pack(event.timestamp, DRIVER_REQUEST,
+                           *driver.location.location, 0, 0, driver.speed,
+                           driver.id.encode())
+    rider = event.rider
+    return record.pack(event.timestamp, RIDER_REQUEST,
+                       *rider.origin.location, *rider.destination.location,
+                       rider.patience, rider.id.encode())
+
+
+class TraceStore:
+    """A memory-mapped trace store file, written by convert_trace.
+
+    === Attributes ===
+    count: The number of events in the store.
+    """
+    # === Private Attributes ===
+    # _file: the open store file.
+    # _map: a read-only memory map of the whole store file.
+    # _record: the layout of one record.
+    # _index_every: the number of records between two index entries.
+    # _index_offset: the offset of the first index entry in the file.
+
+    count: int
+    _file: BinaryIO
+    _map: mmap.mmap
+    _record: struct.Struct
+    _index_every: int
+    _index_offset: int
+
+    def __init__(self, store_filename: str) -> None:
+        """Open the trace store <store_filename> for reading.
+
+        """
+        self._file = open(store_filename, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, id_width, self._index_every, self.count, self._index_offset = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{store_filename} is not a trace store")
+        self._record = _record_struct(id_width)
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return f"TraceStore ({self.count} events)"
+
+    def __enter__(self) -> TraceStore:
+        """Return this store, to be closed at the end of a with block.
+
+        """
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close this store at the end of a with block.
+
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Release the memory map and close the store file.
+
+        """
+        self._map.close()
+        self._file.close()
+
+    def events(self, start: Optional[int] = None,
+               end: Optional[int] = None) -> Iterator[Event]:
+        """Return an iterator over the events with a timestamp of at least
+        <start> and less than <end>, in the order they were converted.
+
+        A bound that is None does not restrict the range. Each event is
+        decoded from the memory map as it is reached, and Simulation.run
+        reads the result one event at a time, so the events are never all in
+        memory at once.
+        """
+        position = 0 if start is None else self._first_at_or_after(start)
+        while position < self.count:
+            event = self._event_at(position)
+            if end is not None and event.timestamp >= end:
+                return
+            yield event
+            position += 1
+
+    def _timestamp_at(self, position: int) -> int:
+        """Return the timestamp of the record at <position>.
+
+        """
+        offset = HEADER.size + position * self._record.size
+        return INDEX_ENTRY.unpack_from(self._map, offset)[0]
+
+    def _first_at_or_after(self, timestamp: int) -> int:
+        """Return the position of the first record whose timestamp is at
+        least <timestamp>, or self.count if there is none.
+
+        """
+        # Binary search the sparse index for the last block that starts
+        # before <timestamp>; the record we want is in it or just after it.
+        low, high = 0, -(-self.count // self._index_every)
+        while low < high:
+            middle = (low + high) // 2
+            offset = self._index_offset + middle * INDEX_ENTRY.size
+            if INDEX_ENTRY.unpack_from(self._map, offset)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        position = max(0, low - 1) * self._index_every
+        while position < self.count and \
+                self._timestamp_at(position) < timestamp:
+            position += 1
+        return position
+
+    def _event_at(self, position: int) -> Event:
+        """Return the event stored at <position>.
+
+        """
+        timestamp, kind, row, col, dest_row, dest_col, value, identifier = \
+            self._record.unpack_from(
+                self._map, HEADER.size + position * self._record.size)
+        identifier = identifier.rstrip(b"\0").decode()
+        if kind == DRIVER_REQUEST:
+            return DriverRequest(
+                timestamp, Driver(identifier, Location(row, col), value))
+        return RiderRequest(
+            timestamp, Rider(identifier, value, Location(row, col),
+                             Location(dest_row, dest_col)))
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['convert_trace', 'TraceStore.__init__'],
+            'extra-imports': ['mmap', 'struct', 'typing', 'compression',
+                              'driver', 'event', 'location', 'rider']})
@@ -39,11 +39,17 @@ IMPORTANT NOTES:
       there.
 """
 import os
+import shutil
 
 from hypothesis import given
 from hypothesis.strategies import integers
 
-from tm_trees import TMTree, FileSystemTree
+from tm_trees import STALE_RECT, TMTree, FileSystemTree
+from fs_scanner import Scanner
+from lazy_tree import LazyFileSystemTree
+from fs_watcher import Watcher
+from layout_engine import layout
+from hit_index import HitIndex
 
 # This should be the path to the "workshop" folder in the sample data.
 # You may need to modify this, depending on where you downloaded and
@@ -182,6 +188,293 @@ def test_extra_test() -> None:
     assert 1 == 1
 
 
+# TEST 7 -----------------------------------------------------------------------
+def test_scanner_builds_same_tree() -> None:
+    """Test that the parallel scanner builds the same tree as the
+    FileSystemTree initializer, and counts what it scanned.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH)
+    scanner = Scanner(workers=4)
+    scanned = scanner.scan(EXAMPLE_PATH)
+    assert _shape(scanned) == _shape(tree)
+    assert scanned.tree_traversal() == tree.tree_traversal()
+    assert (scanner.files, scanner.folders) == (6, 5)
+    assert scanner.files_per_second() > 0
+
+
+# TEST 8 -----------------------------------------------------------------------
+def test_lazy_tree_loads_on_expand() -> None:
+    """Test that a LazyFileSystemTree reads a folder only when it is
+    expanded, and ends up the same as the FileSystemTree once all of it is.
+    """
+    lazy = LazyFileSystemTree(EXAMPLE_PATH)
+    assert lazy._subtrees == []
+    assert lazy.data_size == 151
+    assert 'folder' in lazy.get_suffix()
+
+    lazy.update_rectangles((0, 0, 200, 100))
+    lazy.expand()
+    assert len(lazy._subtrees) == 3
+    assert all(subtree._subtrees == [] for subtree in lazy._subtrees)
+    assert sum(subtree.rect[2] for subtree in lazy._subtrees) == 200
+
+    lazy.expand_all()
+    tree = FileSystemTree(EXAMPLE_PATH)
+    _sort_subtrees(lazy)
+    _sort_subtrees(tree)
+    assert _shape(lazy) == _shape(tree)
+
+
+# TEST 9 -----------------------------------------------------------------------
+def test_scanner_snapshot_lists_changed_folders(tmp_path) -> None:
+    """Test that a scan with a snapshot lists only the folders that changed
+    since the last scan, and still builds the same tree.
+    """
+    path = os.path.join(str(tmp_path), 'workshop')
+    shutil.copytree(EXAMPLE_PATH, path)
+    # Date the copied folders back, so adding a file surely changes a stamp.
+    for folder, _, _ in os.walk(path):
+        os.utime(folder, (0, 0))
+    snapshot = os.path.join(str(tmp_path), 'workshop.snapshot')
+
+    scanner = Scanner(workers=4, snapshot=snapshot)
+    scanner.scan(path)
+    assert scanner.listed == 5
+    assert _shape(scanner.scan(path)) == _shape(FileSystemTree(path))
+    assert scanner.listed == 0
+
+    with open(os.path.join(path, 'prep', 'notes.txt'), 'w') as file:
+        file.write('x' * 10)
+    sizes = scanner.folder_sizes(path)
+    assert scanner.listed == 1
+    assert sizes[path] == 161
+    assert sizes[os.path.join(path, 'prep')] == 32
+    assert _shape(scanner.scan(path)) == _shape(FileSystemTree(path))
+
+
+# TEST 10 ----------------------------------------------------------------------
+def test_watcher_applies_changes(tmp_path) -> None:
+    """Test that a Watcher, with inotify or by polling, updates the tree to
+    match the folder after files are made, grown and removed.
+    """
+    for polling in (True, False):
+        path = os.path.join(str(tmp_path), f'workshop{polling}')
+        shutil.copytree(EXAMPLE_PATH, path)
+        tree = FileSystemTree(path)
+        tree.update_rectangles((0, 0, 200, 100))
+        watcher = Watcher(tree, polling=polling)
+        assert watcher.poll() == []
+
+        notes = os.path.join(path, 'prep', 'notes.txt')
+        with open(notes, 'w') as file:
+            file.write('x' * 10)
+        assert watcher.poll() == [tree]
+        assert tree.data_size == 161
+
+        with open(notes, 'a') as file:
+            file.write('x' * 5)
+        watcher.poll()
+        assert tree.data_size == 166
+
+        shutil.rmtree(os.path.join(path, 'activities'))
+        watcher.poll()
+        assert tree.data_size == 95
+
+        expected = FileSystemTree(path)
+        _sort_subtrees(tree)
+        _sort_subtrees(expected)
+        assert _shape(tree) == _shape(expected)
+        watcher.close()
+
+
+# TEST 11 ----------------------------------------------------------------------
+def test_mutators_keep_sizes_and_depths() -> None:
+    """Test that change_size, move, duplicate, copy_paste and delete_self keep
+    the sizes and depths of the whole tree right without update_data_sizes.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH)
+    workshop = _find(tree, 'workshop')
+    activities = _find(tree, 'activities')
+    leaf = _find(tree, 'Q2.pdf')
+
+    leaf.change_size(0.5)
+    _check_sizes_and_depths(tree)
+    leaf.move(workshop)
+    _check_sizes_and_depths(tree)
+    leaf.duplicate()
+    _check_sizes_and_depths(tree)
+    leaf.copy_paste(activities)
+    _check_sizes_and_depths(tree)
+    assert leaf.delete_self()
+    _check_sizes_and_depths(tree)
+
+
+# TEST 12 ----------------------------------------------------------------------
+def test_update_rectangles_after_change() -> None:
+    """Test that laying out again after a change, which skips the subtrees
+    that did not change or move, gives the same rectangles as laying out the
+    whole tree.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH)
+    tree.update_rectangles((0, 0, 200, 100))
+    leaf = _find(tree, 'Q2.pdf')
+    leaf.change_size(0.5)
+    assert tree.rect == STALE_RECT
+    tree.update_rectangles((0, 0, 200, 100))
+    incremental = _rects(tree)
+
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        node.rect = STALE_RECT
+        stack.extend(node._subtrees)
+    tree.update_rectangles((0, 0, 200, 100))
+    assert _rects(tree) == incremental
+
+
+# TEST 13 ----------------------------------------------------------------------
+@given(integers(min_value=0, max_value=1000),
+       integers(min_value=0, max_value=1000))
+def test_layout_engine_matches_update_rectangles(width, height) -> None:
+    """Test that the layout engine gives every node the same rectangle as
+    update_rectangles.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH)
+    tree.update_rectangles((5, 10, width, height))
+    expected = _rects(tree)
+    layout(tree, (5, 10, width, height))
+    assert _rects(tree) == expected
+
+
+# TEST 14 ----------------------------------------------------------------------
+def test_layout_engine_deep_tree() -> None:
+    """Test that the layout engine lays out a tree too deep to recurse
+    through.
+    """
+    deep = FileSystemTree(os.path.join(EXAMPLE_PATH, 'draft.pptx'))
+    for _ in range(5000):
+        deep = FileSystemTree.from_scan('folder', [deep], 0)
+    layout(deep, (0, 0, 200, 100))
+    while deep._subtrees:
+        deep = deep._subtrees[0]
+    assert deep.rect == (0, 0, 200, 100)
+
+
+# TEST 15 ----------------------------------------------------------------------
+def test_hit_index_matches_get_tree_at_position() -> None:
+    """Test that the hit index finds the same tree as get_tree_at_position
+    everywhere, edges included, with some of the tree expanded.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH)
+    tree.update_rectangles((0, 0, 200, 100))
+    tree.expand()
+    _find(tree, 'activities').expand()
+    index = HitIndex(tree)
+    for x in range(-1, 202):
+        for y in range(-1, 102):
+            assert index.tree_at((x, y)) is tree.get_tree_at_position((x, y))
+
+    tree.expand_all()
+    index.clear()
+    for x in range(-1, 202):
+        for y in range(-1, 102):
+            assert index.tree_at((x, y)) is tree.get_tree_at_position((x, y))
+
+
+# TEST 16 ----------------------------------------------------------------------
+def test_update_data_sizes_with_the_same_total() -> None:
+    """Test that after the sizes of files are set directly and
+    update_data_sizes is called, laying out again moves the files even if the
+    size of their folder did not change.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH)
+    tree.update_rectangles((0, 0, 200, 100))
+    images = _find(_find(tree, 'activities'), 'images')
+    first, second = images._subtrees
+    total = first.data_size + second.data_size
+    first.data_size, second.data_size = total - 1, 1
+    tree.update_data_sizes()
+    tree.update_rectangles((0, 0, 200, 100))
+
+    expected = FileSystemTree(EXAMPLE_PATH)
+    _find(_find(expected, 'activities'), 'images')._subtrees[0].data_size = \
+        total - 1
+    _find(_find(expected, 'activities'), 'images')._subtrees[1].data_size = 1
+    layout(expected, (0, 0, 200, 100))
+    assert _rects(tree) == _rects(expected)
+
+
+# TEST 17 ----------------------------------------------------------------------
+def test_lazy_tree_loads_changed_folders(tmp_path) -> None:
+    """Test that a LazyFileSystemTree expanded after files grew and folders
+    were made has the sizes and layout of the folder as it is when expanded.
+    """
+    path = os.path.join(str(tmp_path), 'workshop')
+    shutil.copytree(EXAMPLE_PATH, path)
+    lazy = LazyFileSystemTree(path)
+    lazy.update_rectangles((0, 0, 200, 100))
+    assert lazy.data_size == 151
+
+    with open(os.path.join(path, 'draft.pptx'), 'a') as file:
+        file.write('x' * 500)
+    os.makedirs(os.path.join(path, 'new', 'inner'))
+    with open(os.path.join(path, 'new', 'inner', 'f'), 'w') as file:
+        file.write('x' * 7)
+    lazy.expand()
+    assert lazy.data_size == 658
+    assert _find(lazy, 'new').data_size == 7
+    rects = _rects(lazy)
+    layout(lazy, (0, 0, 200, 100))
+    assert _rects(lazy) == rects
+
+    lazy.expand_all()
+    _check_sizes_and_depths(lazy)
+    expected = FileSystemTree(path)
+    _sort_subtrees(lazy)
+    _sort_subtrees(expected)
+    assert _shape(lazy) == _shape(expected)
+
+
+# TEST 18 ----------------------------------------------------------------------
+def test_lazy_tree_colours_once_per_action(tmp_path, monkeypatch) -> None:
+    """Test that expanding all of a LazyFileSystemTree, or moving a file into
+    a folder that is not loaded yet, updates the depths and colours of the
+    whole tree only once, and ends up like the FileSystemTree.
+    """
+    path = os.path.join(str(tmp_path), 'generated')
+    for i in range(4):
+        for j in range(5):
+            folder = os.path.join(path, f'a{i}', f'b{j}')
+            os.makedirs(folder)
+            with open(os.path.join(folder, 'f'), 'w') as file:
+                file.write('x' * (i * 5 + j + 1))
+    lazy = LazyFileSystemTree(path)
+    lazy.update_rectangles((0, 0, 200, 100))
+    passes = []
+    update = TMTree.update_colours_and_depths
+
+    def counted(tree: TMTree) -> None:
+        passes.append(tree)
+        update(tree)
+    monkeypatch.setattr(TMTree, 'update_colours_and_depths', counted)
+
+    lazy.expand_all()
+    assert passes == [lazy]
+    tree = FileSystemTree(path)
+    tree.update_rectangles((0, 0, 200, 100))
+    assert _shape(lazy) == _shape(tree)
+    assert lazy.tree_traversal() == tree.tree_traversal()
+    assert _rects(lazy) == _rects(tree)
+
+    lazy = LazyFileSystemTree(path)
+    lazy.expand()
+    lazy._subtrees[0].expand_all()
+    passes.clear()
+    _find(lazy._subtrees[0], 'f').move(lazy._subtrees[1])
+    assert passes == [lazy]
+    _check_sizes_and_depths(lazy)
+
+
 ##############################################################################
 # Helpers
 ##############################################################################
@@ -196,6 +489,47 @@ def is_valid_colour(colour: tuple[int, int, int]) -> bool:
     return True
 
 
+def _shape(tree: TMTree) -> list:
+    """Return the name, path, size and number of subtrees of every node of
+    <tree>, in preorder.
+    """
+    shape = [(tree._name, tree.get_full_path(), tree.data_size,
+              len(tree._subtrees))]
+    for subtree in tree._subtrees:
+        shape.extend(_shape(subtree))
+    return shape
+
+
+def _find(tree: TMTree, name: str) -> TMTree:
+    """Return the first node of <tree> named <name>, in preorder.
+    """
+    if tree._name == name:
+        return tree
+    for subtree in tree._subtrees:
+        found = _find(subtree, name)
+        if found is not None:
+            return found
+    return None
+
+
+def _check_sizes_and_depths(tree: TMTree) -> None:
+    """Check that updating the sizes, depths and colours of <tree> from
+    scratch changes nothing.
+    """
+    before = _shape(tree), tree.tree_traversal()
+    tree.update_data_sizes()
+    assert (_shape(tree), tree.tree_traversal()) == before
+
+
+def _rects(tree: TMTree) -> list:
+    """Return the rectangle of every node of <tree>, in preorder.
+    """
+    rects = [tree.rect]
+    for subtree in tree._subtrees:
+        rects.extend(_rects(subtree))
+    return rects
+
+
 def _sort_subtrees(tree: TMTree) -> None:
     """Sort the subtrees of <tree> in alphabetical order.
     THIS IS FOR THE PURPOSES OF THE SAMPLE TEST ONLY; YOU SHOULD NOT SORT
@@ -0,0 +1,214 @@
+"""
+Assignment 2: Parallel File System Scanner
+
+=== Module Description ===
+This module builds the same FileSystemTree as the FileSystemTree initializer,
+but faster on large folders. Instead of listing each folder with os.listdir
+and then asking os.path.isdir and os.path.getsize about every entry, it lists
+folders with os.scandir, whose entries already know whether they are folders,
+and it lists many folders at once in a pool of threads, so that the waits for
+the disk or the network overlap.
+
+A Scanner can also keep a snapshot of what it listed (see scan_cache), so
+that the next scan of the same folder only lists the folders that changed
+since, and takes the rest from the snapshot.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, \
+    wait
+from typing import Dict, List, Optional, Set, Tuple
+
+from scan_cache import Snapshot, Stamp, save_snapshot, stamp_of
+from tm_trees import FileSystemTree
+
+# An entry of a folder: its path, whether it is a folder, and its size.
+_Entry = Tuple[str, bool, int]
+
+
+class Scanner:
+    """A scanner that builds FileSystemTrees with a pool of threads, and
+    keeps count of how much it scanned.
+
+    === Public Attributes ===
+    workers: The number of threads that list folders at the same time.
+    snapshot: The snapshot file to reuse and update, or None to list every
+        folder on every scan.
+    files: The number of files found by the last scan.
+    folders: The number of folders found by the last scan.
+    listed: The number of folders the last scan listed, rather than took
+        from the snapshot.
+    seconds: How long the last scan took, in seconds.
+    """
+    workers: int
+    snapshot: Optional[str]
+    files: int
+    folders: int
+    listed: int
+    seconds: float
+
+    def __init__(self, workers: Optional[int] = None,
+                 snapshot: Optional[str] = None) -> None:
+        """Initializes a Scanner with <workers> threads, or a few more than
+        there are CPUs if <workers> is None, since most of the time is spent
+        waiting on the file system.
+
+        If <snapshot> is given, each scan takes the entries of the folders
+        that have not changed from that snapshot file, and saves what it
+        found back to it.
+        """
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.snapshot = snapshot
+        self.files = 0
+        self.folders = 0
+        self.listed = 0
+        self.seconds = 0.0
+
+    def files_per_second(self) -> float:
+        """Returns the number of files the last scan found per second.
+        """
+        return self.files / self.seconds if self.seconds > 0 else 0.0
+
+    def scan(self, path: str) -> FileSystemTree:
+        """Returns the FileSystemTree of <path>, which is the same as
+        FileSystemTree(path), with its subtrees in the same order.
+
+        Precondition: <path> is a valid path for this computer.
+        """
+        start = time.perf_counter()
+        self.files = self.folders = self.listed = 0
+        if os.path.isdir(path):
+            listings = self._list_all(path)
+            tree = _assemble(path, listings)
+        else:
+            self.files = 1
+            tree = FileSystemTree.from_scan(path, [], os.path.getsize(path))
+        tree.update_colours_and_depths()
+        self.seconds = time.perf_counter() - start
+        return tree
+
+    def folder_sizes(self, path: str) -> Dict[str, int]:
+        """Returns the total size of the files in the folder <path> and in
+        each folder in it, keyed by folder path, without building any trees.
+
+        Precondition: <path> is a valid path to a folder on this computer.
+        """
+        start = time.perf_counter()
+        self.files = self.folders = self.listed = 0
+        listings = self._list_all(path)
+        sizes = {}
+        for folder in reversed(_folders_in_order(path, listings)):
+            sizes[folder] = sum(sizes[entry_path] if is_folder else size
+                                for entry_path, is_folder, size
+                                in listings.pop(folder))
+        self.seconds = time.perf_counter() - start
+        return sizes
+
+    def _list_all(self, path: str) -> Dict[str, List[_Entry]]:
+        """Returns the entries of the folder <path> and of every folder in
+        it, keyed by folder path.
+
+        If this Scanner has a snapshot file, the folders whose stamps have
+        not changed are taken from it, and it is saved again if anything
+        did change.
+        """
+        snapshot = Snapshot(self.snapshot) if self.snapshot else None
+        listings = {}
+        stamps = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending: Set[Future] = {pool.submit(_list_folder, path,
+                                                snapshot)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    folder, entries, stamp, listed = future.result()
+                    listings[folder] = entries
+                    stamps[folder] = stamp
+                    self.folders += 1
+                    self.listed += listed
+                    for entry_path, is_folder, _ in entries:
+                        if is_folder:
+                            pending.add(pool.submit(_list_folder,
+                                                    entry_path, snapshot))
+                        else:
+                            self.files += 1
+
+        if snapshot is not None:
+            # Folders that were removed also make the snapshot out of date.
+            changed = self.listed > 0 or len(snapshot) != len(stamps)
+            snapshot.close()
+            if changed:
+                save_snapshot(self.snapshot, listings, stamps)
+        return listings
+
+
+def _list_folder(path: str, snapshot: Optional[Snapshot]) \
+        -> Tuple[str, List[_Entry], Optional[Stamp], bool]:
+    """Returns <path>, the entries of the folder <path> in the order
+    os.listdir gives them, the stamp of the folder if there is a <snapshot>,
+    and whether the folder was listed rather than taken from <snapshot>.
+    """
+    stamp = None
+    if snapshot is not None:
+        # The stamp is taken first, so a change made while the folder is
+        # being listed makes the next scan list it again.
+        stamp = stamp_of(path)
+        entries = snapshot.entries(path, stamp)
+        if entries is not None:
+            return path, entries, stamp, False
+
+    entries = []
+    with os.scandir(path) as scan:
+        for entry in scan:
+            # Like os.path.isdir and os.path.getsize, these follow links.
+            if entry.is_dir():
+                entries.append((entry.path, True, 0))
+            else:
+                entries.append((entry.path, False, entry.stat().st_size))
+    return path, entries, stamp, True
+
+
+def _assemble(path: str,
+              listings: Dict[str, List[_Entry]]) -> FileSystemTree:
+    """Returns the FileSystemTree of the folder <path>, built from the folder
+    entries in <listings>.
+    """
+    # Build the trees children first, so deep folders need no recursion.
+    trees = {}
+    for folder in reversed(_folders_in_order(path, listings)):
+        subtrees = []
+        for entry_path, is_folder, size in listings[folder]:
+            if is_folder:
+                subtrees.append(trees.pop(entry_path))
+            else:
+                subtrees.append(FileSystemTree.from_scan(entry_path, [],
+                                                         size))
+        trees[folder] = FileSystemTree.from_scan(folder, subtrees, 0)
+    return trees[path]
+
+
+def _folders_in_order(path: str,
+                      listings: Dict[str, List[_Entry]]) -> List[str]:
+    """Returns the folder <path> and every folder in it whose entries are in
+    <listings>, each folder before the folders in it.
+    """
+    order = [path]
+    i = 0
+    while i < len(order):
+        order.extend(entry_path for entry_path, is_folder, _
+                     in listings[order[i]] if is_folder)
+        i += 1
+    return order
+
+
+if __name__ == '__main__':
+    # Usage: python fs_scanner.py [folder] [snapshot file]
+    SCANNER = Scanner(snapshot=sys.argv[2] if len(sys.argv) > 2 else None)
+    SCANNED = SCANNER.scan(sys.argv[1] if len(sys.argv) > 1 else os.getcwd())
+    print(f'{SCANNER.files} files, {SCANNER.folders} folders '
+          f'({SCANNER.listed} listed), '
+          f'{SCANNED.data_size} bytes in {SCANNER.seconds:.2f}s '
+          f'({SCANNER.files_per_second():.0f} files/sec)')
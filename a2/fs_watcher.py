@@ -0,0 +1,355 @@
+"""
+Assignment 2: File System Watcher
+
+=== Module Description ===
+This module keeps a FileSystemTree up to date with the folder it was made
+from while it is on screen. On Linux it asks the kernel, through inotify, to
+report the folders that change; elsewhere, or if inotify cannot be used, it
+compares every folder with the tree each time it is polled.
+
+A change only touches the nodes it is about: a file that grows or shrinks
+changes the data_size of its ancestors and nothing else, and only the part
+of the treemap whose layout changed needs new rectangles.
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+from typing import Dict, List, Optional, Set
+
+from tm_trees import TMTree, FileSystemTree
+
+# inotify flags, from <sys/inotify.h>.
+_IN_MODIFY = 0x00000002
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_RELIST = _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_MASK = _IN_MODIFY | _IN_RELIST | _IN_ONLYDIR
+
+_EVENT = struct.Struct('iIII')
+
+# The changes to apply to each folder, keyed by folder path: None if the
+# folder has to be listed again, or else the names of the files in it that
+# may have changed size.
+_Changes = Dict[str, Optional[Set[str]]]
+
+
+class Watcher:
+    """A watcher that applies the changes made to a folder to the
+    FileSystemTree of that folder.
+
+    Only FileSystemTrees that are fully built can be watched; a
+    LazyFileSystemTree's folders that are not loaded yet have no subtrees to
+    update.
+
+    === Public Attributes ===
+    tree: The tree that is kept up to date.
+    polling: Whether changes are found by comparing every folder with the
+        tree, rather than by inotify.
+
+    === Private Attributes ===
+    _nodes: The node of <tree> for each path in it.
+    _folders: The paths of the folders in <tree>.
+    _inotify: What reports changes to the folders, or None if polling.
+    """
+    tree: FileSystemTree
+    polling: bool
+    _nodes: Dict[str, FileSystemTree]
+    _folders: Set[str]
+    _inotify: Optional[_Inotify]
+
+    def __init__(self, tree: FileSystemTree, polling: bool = False) -> None:
+        """Initializes a Watcher of <tree>, which polls if <polling> is True
+        or inotify is not available.
+
+        Precondition: <tree> is the FileSystemTree of a folder.
+        """
+        self.tree = tree
+        self._nodes = {}
+        self._folders = set()
+        self._inotify = None
+        if not polling:
+            try:
+                self._inotify = _Inotify()
+            except OSError:
+                pass
+        self.polling = self._inotify is None
+        self._index(tree)
+
+    def close(self) -> None:
+        """Stops watching for changes.
+        """
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def poll(self) -> List[TMTree]:
+        """Applies the changes made since the last poll to the tree, and
+        returns the trees whose subtrees need to be laid out again. None of
+        the returned trees is inside another.
+        """
+        if self._inotify is None:
+            changes = dict.fromkeys(self._folders)
+        else:
+            changes = self._inotify.read()
+            if changes is None:
+                # Too many changes were made to report them all.
+                changes = dict.fromkeys(self._folders)
+
+        regions = []
+        structure_changed = False
+        for folder_path, names in changes.items():
+            folder = self._nodes.get(folder_path)
+            if folder is None or folder_path not in self._folders:
+                # A folder removed or moved out since the change was made.
+                continue
+            if names is None:
+                structure_changed |= self._relist(folder, regions)
+            else:
+                for name in names:
+                    node = self._nodes.get(os.path.join(folder_path, name))
+                    if node is not None and \
+                            node.get_full_path() not in self._folders:
+                        self._resize(node, regions)
+
+        if structure_changed:
+            # New and removed nodes can change the depth of the tree, and so
+            # the shades of all of its folders.
+            self.tree.update_colours_and_depths()
+        return _outermost(regions)
+
+    def _relist(self, folder: FileSystemTree, regions: List[TMTree]) -> bool:
+        """Compares the entries of <folder> with its subtrees, applies the
+        differences, and adds the affected trees to <regions>. Returns
+        whether any subtree was added or removed.
+        """
+        try:
+            with os.scandir(folder.get_full_path()) as scan:
+                entries = {entry.name: entry for entry in scan}
+        except (FileNotFoundError, NotADirectoryError):
+            # Its own parent will notice that it is gone.
+            return False
+
+        changed = False
+        for subtree in list(folder._subtrees):
+            entry = entries.get(subtree._name)
+            was_folder = subtree.get_full_path() in self._folders
+            if entry is None or entry.is_dir() != was_folder:
+                self._remove(subtree, regions)
+                changed = True
+            elif not was_folder:
+                self._resize(subtree, regions)
+
+        known = {subtree._name for subtree in folder._subtrees}
+        for name, entry in entries.items():
+            if name not in known:
+                changed |= self._add(folder, entry.path, regions)
+        return changed
+
+    def _add(self, folder: FileSystemTree, path: str,
+             regions: List[TMTree]) -> bool:
+        """Adds the tree of <path> as the last subtree of <folder>, and adds
+        the affected trees to <regions>. Returns whether it was added.
+        """
+        try:
+            subtree = FileSystemTree(path)
+        except FileNotFoundError:
+            # Made and removed again before we got to it.
+            return False
+        subtree._parent_tree = folder
+        folder._subtrees.append(subtree)
+        self._index(subtree)
+        regions.append(self._propagate(folder, subtree.data_size))
+        return True
+
+    def _remove(self, subtree: FileSystemTree,
+                regions: List[TMTree]) -> None:
+        """Removes <subtree> from its parent, and adds the affected trees to
+        <regions>.
+        """
+        parent = subtree.get_parent()
+        parent._subtrees.remove(subtree)
+        self._unindex(subtree)
+        regions.append(self._propagate(parent, -subtree.data_size))
+
+    def _resize(self, leaf: FileSystemTree, regions: List[TMTree]) -> None:
+        """Sets the data_size of the file <leaf> to the size of the file now,
+        and adds the affected trees to <regions> if it changed.
+        """
+        try:
+            size = os.path.getsize(leaf.get_full_path())
+        except FileNotFoundError:
+            # Its folder will report that it was removed.
+            return
+        if size != leaf.data_size:
+            delta = size - leaf.data_size
+            leaf.data_size = size
+            regions.append(self._propagate(leaf.get_parent(), delta))
+
+    def _propagate(self, folder: TMTree, delta: int) -> TMTree:
+        """Adds <delta> to the sizes of <folder> and its ancestors, and
+        returns the tree whose subtrees need to be laid out again: <folder>
+        if its size did not change, and otherwise the whole tree, since the
+        share of each ancestor in its parent changed.
+        """
+        if delta == 0:
+            return folder
+        folder._add_to_sizes(delta)
+        return self.tree
+
+    def _index(self, tree: FileSystemTree) -> None:
+        """Records the nodes of <tree>, and watches its folders.
+        """
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            path = node.get_full_path()
+            self._nodes[path] = node
+            if node._subtrees or os.path.isdir(path):
+                self._folders.add(path)
+                if self._inotify is not None:
+                    self._inotify.watch(path)
+            stack.extend(node._subtrees)
+
+    def _unindex(self, tree: FileSystemTree) -> None:
+        """Forgets the nodes of <tree>, and stops watching its folders.
+        """
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            path = node.get_full_path()
+            self._nodes.pop(path, None)
+            if path in self._folders:
+                self._folders.remove(path)
+                if self._inotify is not None:
+                    self._inotify.unwatch(path)
+            stack.extend(node._subtrees)
+
+
+class _Inotify:
+    """The inotify instance of a Watcher, used through ctypes.
+
+    === Private Attributes ===
+    _libc: the C library.
+    _fd: the inotify file descriptor.
+    _paths: the folder path of each watch descriptor.
+    _descriptors: the watch descriptor of each folder path.
+    """
+    _libc: ctypes.CDLL
+    _fd: int
+    _paths: Dict[int, str]
+    _descriptors: Dict[str, int]
+
+    def __init__(self) -> None:
+        """Starts an inotify instance, or raises OSError if that cannot be
+        done on this computer.
+        """
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only on Linux')
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                 use_errno=True)
+        try:
+            self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        except AttributeError as error:
+            raise OSError(errno.ENOSYS, 'no inotify in libc') from error
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self._paths = {}
+        self._descriptors = {}
+
+    def close(self) -> None:
+        """Closes the inotify instance, which removes all of its watches.
+        """
+        os.close(self._fd)
+
+    def watch(self, path: str) -> None:
+        """Reports changes to the entries of the folder <path> from now on.
+        """
+        descriptor = self._libc.inotify_add_watch(self._fd,
+                                                  os.fsencode(path), _MASK)
+        if descriptor < 0:
+            code = ctypes.get_errno()
+            if code in (errno.ENOENT, errno.ENOTDIR):
+                # Removed already; its parent reports that.
+                return
+            raise OSError(code, os.strerror(code), path)
+        self._paths[descriptor] = path
+        self._descriptors[path] = descriptor
+
+    def unwatch(self, path: str) -> None:
+        """Stops reporting changes to the folder <path>.
+        """
+        descriptor = self._descriptors.pop(path, None)
+        if descriptor is not None:
+            del self._paths[descriptor]
+            self._libc.inotify_rm_watch(self._fd, descriptor)
+
+    def read(self) -> Optional[_Changes]:
+        """Returns the changes reported since the last read, or None if the
+        kernel dropped some of them.
+        """
+        changes = {}
+        while True:
+            try:
+                data = os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                return changes
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, _, length = _EVENT.unpack_from(data,
+                                                                 offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + length]
+                                   .rstrip(b'\0'))
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    return None
+                path = self._paths.get(descriptor)
+                if path is None:
+                    continue
+                if mask & _IN_IGNORED:
+                    # The folder itself is gone.
+                    del self._paths[descriptor]
+                    self._descriptors.pop(path, None)
+                elif mask & _IN_RELIST:
+                    changes[path] = None
+                elif changes.get(path, set()) is not None:
+                    changes.setdefault(path, set()).add(name)
+
+
+def _outermost(trees: List[TMTree]) -> List[TMTree]:
+    """Returns the trees in <trees> that are not inside another one of them,
+    each only once.
+    """
+    chosen = {id(tree) for tree in trees}
+    seen = set()
+    outermost = []
+    for tree in trees:
+        ancestor = tree.get_parent()
+        while ancestor is not None and id(ancestor) not in chosen:
+            ancestor = ancestor.get_parent()
+        if ancestor is None and id(tree) not in seen:
+            seen.add(id(tree))
+            outermost.append(tree)
+    return outermost
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['ctypes', 'ctypes.util', 'errno', 'os', 'struct',
+                          'sys', 'typing', 'tm_trees']
+    })
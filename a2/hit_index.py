@@ -0,0 +1,101 @@
+"""
+Assignment 2: Hit Testing Index
+
+=== Module Description ===
+This module finds the displayed tree at a position, the same one that
+TMTree.get_tree_at_position finds, without trying each child of each tree on
+the way down in turn. The children of a tree are laid out one after another
+along one side of its rectangle, so the child at a position can be found by
+binary search over where the children end along that side.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from tm_trees import TMTree
+
+# A tree, the side its children are laid out along (0 for across, 1 for
+# down), where each of its children with a size ends along that side, and
+# those children.
+_Offsets = Tuple[TMTree, int, List[int], List[TMTree]]
+
+
+class HitIndex:
+    """An index of a laid out tree that finds the displayed tree at a
+    position in time that grows with the depth of the tree and the logarithm
+    of the number of children on the way, not their sum.
+
+    The index remembers where the children of each tree it searched through
+    end, so it must be cleared whenever the tree is laid out again.
+
+    === Public Attributes ===
+    tree: The tree that is searched.
+
+    === Private Attributes ===
+    _offsets: the offsets of the children of each tree searched through so
+        far, keyed by the id of the tree.
+    """
+    tree: TMTree
+    _offsets: Dict[int, _Offsets]
+
+    def __init__(self, tree: TMTree) -> None:
+        """Initializes an index of <tree>, which must be laid out.
+        """
+        self.tree = tree
+        self._offsets = {}
+
+    def clear(self) -> None:
+        """Forgets the offsets of the children, after the tree is laid out
+        again.
+        """
+        self._offsets = {}
+
+    def tree_at(self, pos: Tuple[int, int]) -> Optional[TMTree]:
+        """Returns what self.tree.get_tree_at_position(<pos>) returns: the
+        displayed tree whose rectangle contains <pos>, the leftmost and
+        topmost one if <pos> is on an edge, or None if <pos> is outside of
+        the tree's rectangle.
+        """
+        x, y, width, height = self.tree.rect
+        if not (x <= pos[0] <= x + width and y <= pos[1] <= y + height):
+            return None
+        if pos == (0, 0):
+            # Trees with no size have the rectangle (0, 0, 0, 0), so only
+            # here can they be found, and they are not in the offsets.
+            return self.tree.get_tree_at_position(pos)
+
+        tree = self.tree
+        while tree._expanded and tree._subtrees:
+            _, side, ends, children = self._offsets_of(tree)
+            # Children share their edges, so the first one that ends at or
+            # after <pos> is the leftmost or topmost one that contains it.
+            i = bisect_left(ends, pos[side])
+            if i == len(ends):
+                return None
+            tree = children[i]
+        return tree
+
+    def _offsets_of(self, tree: TMTree) -> _Offsets:
+        """Returns the offsets of the children of <tree>, working them out
+        if this is the first time they are needed.
+        """
+        offsets = self._offsets.get(id(tree))
+        if offsets is None:
+            side = 0 if tree.rect[2] > tree.rect[3] else 1
+            children = [child for child in tree._subtrees
+                        if child.data_size > 0 and not child.is_empty()]
+            ends = [child.rect[side] + child.rect[side + 2]
+                    for child in children]
+            # The tree is kept, so that its id cannot be reused.
+            offsets = (tree, side, ends, children)
+            self._offsets[id(tree)] = offsets
+        return offsets
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['bisect', 'typing', 'tm_trees']
+    })
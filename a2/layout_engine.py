@@ -0,0 +1,113 @@
+"""
+Assignment 2: Array Layout Engine
+
+=== Module Description ===
+This module lays out a whole TMTree with the same treemap algorithm as
+TMTree.update_rectangles, and gives every node exactly the same rectangle,
+but without recursion and without working out one child at a time.
+
+The tree is laid out a level at a time. The children of all the nodes on a
+level are put in one array, and their widths (or heights) are found with one
+NumPy division, and their offsets with one cumulative sum that restarts at
+the first child of each parent.
+"""
+from __future__ import annotations
+
+import math
+from collections import deque
+from itertools import chain, compress, repeat
+from operator import attrgetter
+from typing import Tuple
+
+import numpy as np
+
+from tm_trees import TMTree
+
+# Below this value of (parent size * parent width), a child's width
+# size * width // parent_size, worked out exactly on integers, is the same as
+# math.trunc(size * width / parent_size) with floats. Parents with larger
+# values are worked out like update_rectangles does, one child at a time.
+_EXACT_LIMIT = 2 ** 50
+
+_SUBTREES = attrgetter('_subtrees')
+_DATA_SIZE = attrgetter('data_size')
+
+
+def layout(tree: TMTree, rect: Tuple[int, int, int, int]) -> None:
+    """Sets the rectangles of <tree> and its descendants to fill <rect>, the
+    same as tree.update_rectangles(rect) does when every node is laid out
+    again.
+    """
+    if tree.data_size == 0 or tree.is_empty():
+        tree.rect = (0, 0, 0, 0)
+        return
+    tree.rect = rect
+
+    # The trees on the current level that have a size, with their
+    # rectangles and sizes. An empty tree always has a size of 0.
+    level = [tree]
+    boxes = np.array([rect], np.int64)
+    totals = np.array([tree.data_size], np.int64)
+    while level:
+        subtrees = list(map(_SUBTREES, level))
+        counts = np.fromiter(map(len, subtrees), np.int64, len(level))
+        children = list(chain.from_iterable(subtrees))
+        if not children:
+            return
+        sizes = np.fromiter(map(_DATA_SIZE, children), np.int64,
+                            len(children))
+        owner = np.repeat(np.arange(len(level)), counts)
+
+        # Wide parents split their width, and the rest split their height.
+        wide = boxes[:, 2] > boxes[:, 3]
+        starts = np.where(wide, boxes[:, 0], boxes[:, 1])
+        lengths = np.where(wide, boxes[:, 2], boxes[:, 3])
+
+        spans = sizes * lengths[owner] // totals[owner]
+        inexact = (totals.astype(float) * lengths >= _EXACT_LIMIT) \
+            | (lengths < 0)
+        if inexact.any():
+            for i in np.flatnonzero(inexact[owner]):
+                spans[i] = math.trunc(int(sizes[i]) * int(lengths[owner[i]])
+                                      / int(totals[owner[i]]))
+
+        # The offset of each child from the start of its parent, and the last
+        # child of each parent takes up whatever is left.
+        has_children = counts > 0
+        last = (np.cumsum(counts) - 1)[has_children]
+        first = last - counts[has_children] + 1
+        running = np.cumsum(spans) - spans
+        base = np.zeros(len(level), np.int64)
+        base[has_children] = running[first]
+        offsets = running - base[owner]
+        spans[last] = lengths[has_children] - offsets[last]
+
+        # Each child has its parent's rectangle, apart from its place and
+        # length along the side that is split.
+        positions = starts[owner] + offsets
+        child_wide = wide[owner]
+        child_tall = ~child_wide
+        boxes = boxes[owner]
+        boxes[child_wide, 0] = positions[child_wide]
+        boxes[child_wide, 2] = spans[child_wide]
+        boxes[child_tall, 1] = positions[child_tall]
+        boxes[child_tall, 3] = spans[child_tall]
+
+        # Trees without a size get an empty rectangle and are not split.
+        placed = sizes > 0
+        boxes[~placed] = 0
+        # Set every rect in one pass in C, which is most of the time left.
+        deque(map(setattr, children, repeat('rect'),
+                  zip(*(boxes[:, i].tolist() for i in range(4)))), maxlen=0)
+        level = list(compress(children, placed.tolist()))
+        boxes = boxes[placed]
+        totals = sizes[placed]
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['math', 'collections', 'itertools', 'operator',
+                          'typing', 'numpy', 'tm_trees']
+    })
@@ -0,0 +1,129 @@
+"""
+Assignment 2: Lazily Loaded File System Trees
+
+=== Module Description ===
+This module contains LazyFileSystemTree, a FileSystemTree that does not make
+trees for the contents of a folder until the folder is first expanded. Until
+then, a folder is a single node that knows only its total size, which comes
+from one fast pass over the file system (or from sizes the caller already
+has), so a treemap of a huge folder can be shown right away.
+"""
+from __future__ import annotations
+
+import os
+from typing import Dict, Optional
+
+from fs_scanner import Scanner
+from tm_trees import STALE_RECT, FileSystemTree
+
+
+class LazyFileSystemTree(FileSystemTree):
+    """A FileSystemTree whose folders load their contents when they are first
+    expanded.
+
+    A folder that has not been loaded has no subtrees, but it is not a leaf:
+    its data_size is the total size of everything in it, it is coloured as a
+    folder, and it cannot be resized like a file.
+
+    === Private Attributes ===
+    _folder: whether this tree is a folder.
+    _loaded: whether the subtrees of this tree have been made; always True
+        for a file.
+    _sizes: the total size of each folder under the root that has not been
+        loaded yet, keyed by path. Every tree of the same root shares it.
+    """
+    _folder: bool
+    _loaded: bool
+    _sizes: Dict[str, int]
+
+    def __init__(self, my_path: str,
+                 sizes: Optional[Dict[str, int]] = None) -> None:
+        """Makes a tree for <my_path> that has not loaded its contents yet.
+
+        <sizes> gives the total size of <my_path> and of each folder in it,
+        keyed by path; if it is None, the sizes are found with a Scanner.
+
+        Precondition: <my_path> is a valid path for this computer.
+        """
+        folder = os.path.isdir(my_path)
+        if sizes is None:
+            sizes = Scanner().folder_sizes(my_path) if folder else {}
+        size = sizes.get(my_path, 0) if folder \
+            else os.path.getsize(my_path)
+        self._init_lazy(my_path, folder, size, sizes)
+        self.update_colours_and_depths()
+
+    def _init_lazy(self, my_path: str, folder: bool, data_size: int,
+                   sizes: Dict[str, int]) -> None:
+        """Initializes this tree as an unloaded tree for <my_path>, which is
+        a folder iff <folder>, with <data_size>.
+        """
+        self._init_node(os.path.basename(my_path), [], data_size)
+        self._path = my_path
+        self._folder = folder
+        self._loaded = not folder
+        self._sizes = sizes
+
+    def _is_leaf(self) -> bool:
+        """Returns whether this tree is a file, or a loaded empty folder.
+        """
+        return not self._folder or (self._loaded and not self._subtrees)
+
+    def _load(self) -> bool:
+        """Makes the trees for the contents of this folder, if that has not
+        been done yet, and returns whether it was done.
+        """
+        if self._loaded:
+            return False
+        self._loaded = True
+        subtrees = []
+        with os.scandir(self._path) as scan:
+            for entry in scan:
+                subtree = LazyFileSystemTree.__new__(LazyFileSystemTree)
+                if entry.is_dir():
+                    subtree._init_lazy(entry.path, True,
+                                       self._size_of(entry.path),
+                                       self._sizes)
+                else:
+                    subtree._init_lazy(entry.path, False,
+                                       entry.stat().st_size, self._sizes)
+                subtree._parent_tree = self
+                subtree._depth = self._depth + 1
+                subtrees.append(subtree)
+        self._subtrees = subtrees
+
+        # The size of this folder was found before it was listed, so files
+        # may have changed since; its size and those of its ancestors must
+        # be the sum of what is in it now.
+        delta = sum(subtree.data_size for subtree in subtrees) \
+            - self.data_size
+        if delta:
+            self._add_to_sizes(delta)
+        else:
+            # Mark the path to the root out of date, up to a tree that
+            # already is, whose ancestors already are too.
+            tree = self
+            while tree is not None and tree.rect != STALE_RECT:
+                tree.rect = STALE_RECT
+                tree = tree._parent_tree
+        return True
+
+    def _size_of(self, path: str) -> int:
+        """Returns the total size of the folder <path> in this folder, and
+        forgets it. A folder made after the sizes were found is sized now,
+        with the folders in it.
+        """
+        size = self._sizes.pop(path, None)
+        if size is None:
+            sizes = Scanner().folder_sizes(path)
+            size = sizes.pop(path)
+            self._sizes.update(sizes)
+        return size
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['os', 'typing', 'fs_scanner', 'tm_trees']
+    })
@@ -0,0 +1,159 @@
+"""
+Assignment 2: Scan Snapshots
+
+=== Module Description ===
+This module saves the folder listings found by a scan to a compact binary
+snapshot, and reads them back through a memory map, so that the next scan of
+the same folder only has to list the folders that changed.
+
+A snapshot file is a header followed by one record per folder:
+
+    header:  magic (4 bytes), number of folders (uint32)
+    folder:  mtime in ns (int64), inode (uint64), length of the path (uint32),
+             length of the entries (uint32), number of entries (uint32),
+             the path in UTF-8, then the entries
+    entry:   is a folder (uint8), size (int64), length of the name (uint16),
+             the name in UTF-8
+
+A folder's mtime changes when an entry is added to it, removed from it or
+renamed, but not when a file in it is rewritten in place, so a snapshot does
+not notice files that only changed size.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+# An entry of a folder: its path, whether it is a folder, and its size.
+_Entry = Tuple[str, bool, int]
+
+# When a folder last changed, as its mtime in nanoseconds and its inode.
+Stamp = Tuple[int, int]
+
+_MAGIC = b'TMS1'
+_HEADER = struct.Struct('<4sI')
+_FOLDER = struct.Struct('<qQIII')
+_ENTRY = struct.Struct('<BqH')
+
+
+def stamp_of(path: str) -> Stamp:
+    """Returns the stamp of the folder <path> as it is now.
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_ino
+
+
+class Snapshot:
+    """The folder listings saved by an earlier scan, read from a memory
+    mapped snapshot file.
+
+    Only the folder records are read when a Snapshot is made; the entries of
+    a folder are decoded when they are asked for.
+
+    === Private Attributes ===
+    _map: the memory map of the snapshot file, or None if there was no
+        usable snapshot file.
+    _index: the stamp of each saved folder, and where its entries start in
+        <_map> and how many there are, keyed by folder path.
+    """
+    _map: Optional[mmap.mmap]
+    _index: Dict[str, Tuple[Stamp, int, int]]
+
+    def __init__(self, filename: str) -> None:
+        """Reads the folder records of the snapshot file <filename>. If the
+        file does not exist or is not a snapshot, the Snapshot is empty.
+        """
+        self._map = None
+        self._index = {}
+        try:
+            with open(filename, 'rb') as file:
+                self._map = mmap.mmap(file.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # A missing or empty file just means nothing was saved yet.
+            return
+        if self._map[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            return
+
+        _, count = _HEADER.unpack_from(self._map, 0)
+        offset = _HEADER.size
+        for _ in range(count):
+            mtime, inode, path_length, entries_length, entry_count = \
+                _FOLDER.unpack_from(self._map, offset)
+            offset += _FOLDER.size
+            path = self._map[offset:offset + path_length].decode()
+            offset += path_length
+            self._index[path] = ((mtime, inode), offset, entry_count)
+            offset += entries_length
+
+    def __len__(self) -> int:
+        """Returns the number of folders in this snapshot.
+        """
+        return len(self._index)
+
+    def close(self) -> None:
+        """Closes the snapshot file. The Snapshot is empty afterwards.
+        """
+        if self._map is not None:
+            self._map.close()
+        self._map = None
+        self._index = {}
+
+    def entries(self, path: str, stamp: Stamp) -> Optional[List[_Entry]]:
+        """Returns the saved entries of the folder <path>, or None if it was
+        not saved or has changed since, which is when its <stamp> is not the
+        saved one.
+        """
+        record = self._index.get(path)
+        if record is None or record[0] != stamp:
+            return None
+        _, offset, count = record
+        entries = []
+        for _ in range(count):
+            is_folder, size, name_length = _ENTRY.unpack_from(self._map,
+                                                              offset)
+            offset += _ENTRY.size
+            name = self._map[offset:offset + name_length].decode()
+            offset += name_length
+            entries.append((os.path.join(path, name), bool(is_folder), size))
+        return entries
+
+
+def save_snapshot(filename: str, listings: Dict[str, List[_Entry]],
+                  stamps: Dict[str, Stamp]) -> None:
+    """Saves the entries in <listings> of each folder in <stamps>, with its
+    stamp, to the snapshot file <filename>.
+
+    The file is replaced all at once, so a Snapshot of the old file that is
+    still open keeps working.
+    """
+    records = []
+    for path, (mtime, inode) in stamps.items():
+        entries = []
+        for entry_path, is_folder, size in listings[path]:
+            name = os.path.basename(entry_path).encode()
+            entries.append(_ENTRY.pack(is_folder, size, len(name)))
+            entries.append(name)
+        entries = b''.join(entries)
+        encoded = path.encode()
+        records.append(_FOLDER.pack(mtime, inode, len(encoded), len(entries),
+                                    len(listings[path])))
+        records.append(encoded)
+        records.append(entries)
+
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(_HEADER.pack(_MAGIC, len(stamps)))
+        file.writelines(records)
+    os.replace(temporary, filename)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['mmap', 'os', 'struct', 'typing']
+    })
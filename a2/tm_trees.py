@@ -26,6 +26,10 @@ import os
 from random import randint
 from typing import List, Tuple, Optional
 
+# The rect of a tree whose layout is out of date because its size or its
+# subtrees changed since it was last laid out. No layout gives this rect.
+STALE_RECT = (0, 0, -1, -1)
+
 
 def get_colour() -> Tuple[int, int, int]:
     """This function picks a random colour selectively such that it is not on
@@ -61,7 +65,8 @@ class TMTree:
     You can, however, freely add private methods as needed.
 
     === Public Attributes ===
-    rect: The pygame rectangle representing this node in the visualization.
+    rect: The pygame rectangle representing this node in the visualization,
+        or STALE_RECT if this tree changed since it was last laid out.
     data_size: The size of the data represented by this tree.
 
     === Private Attributes ===
@@ -105,6 +110,23 @@ class TMTree:
 
         Precondition: if <name> is None, then <subtrees> is empty.
         """
+        self._init_node(name, subtrees, data_size)
+
+        # because update_colours_and_depths needs to be called every time
+        # a change is made, or instantiation is done, we must call it here
+        self.update_colours_and_depths()
+
+    def _init_node(self, name: str, subtrees: List[TMTree],
+                   data_size: int = 0) -> None:
+        """Initializes this node like __init__ does, except that the depths
+        and colours of the tree are left for a later call of
+        update_colours_and_depths.
+
+        Building a tree bottom-up with __init__ recolours every subtree
+        each time a node is added above it. A tree built with _init_node
+        instead, and coloured once from its root, takes time linear in its
+        number of nodes.
+        """
         self.rect = (0, 0, 0, 0)
         self._parent_tree = None
         self._depth = 0
@@ -136,10 +158,6 @@ class TMTree:
         for sub in subtrees:
             sub._parent_tree = self
 
-        # because update_colours_and_depths needs to be called every time
-        # a change is made, or instantiation is done, we must call it here
-        self.update_colours_and_depths()
-
     def is_empty(self) -> bool:
         """Returns True iff this tree is empty.
         """
@@ -157,6 +175,11 @@ class TMTree:
     def update_rectangles(self, rect: Tuple[int, int, int, int]) -> None:
         """Updates the rectangles in this tree and its descendants using the
         treemap algorithm to fill the area defined by the <rect> parameter.
+
+        A subtree that gets the same rectangle as it already has, and has not
+        changed since it was last laid out, keeps the layout it has, so after
+        a change only the changed trees and the subtrees that move are laid
+        out again.
         """
         # Read the Treemap Algorithm description in the handout thoroughly and
         # implement this algorithm to set the <rect> parameter for each
@@ -180,10 +203,10 @@ class TMTree:
 
         self.rect = rect
 
+        # colours and depths do not depend on the layout, so they are left
+        # to the methods that change the structure of the tree
         if self.data_size == 0 or self.is_empty():
             self.rect = (0, 0, 0, 0)
-            # updates the colours and depths after every change
-            self.update_colours_and_depths()
 
         else:
             if width > height:
@@ -192,14 +215,12 @@ class TMTree:
                     # remaining space, else, the size must be proportional to
                     # the width and the subtree's data size
                     new_width = bottom_right_x - x_coord \
-                        if subtree == self._subtrees[-1] \
+                        if subtree is self._subtrees[-1] \
                         else math.trunc(subtree.data_size
                                         * width / self.data_size)
 
-                    subtree.update_rectangles((x_coord, y_coord,
+                    subtree._update_rectangle((x_coord, y_coord,
                                                new_width, height))
-                    # update the colours and depths after every change
-                    subtree.update_colours_and_depths()
 
                     # this updates the x_coord (not the intial_x) for
                     # the next iteration
@@ -210,15 +231,21 @@ class TMTree:
                     # the comments for this are analogous to
                     # the previous one
                     new_height = bottom_right_y - y_coord \
-                        if subtree == self._subtrees[-1] \
+                        if subtree is self._subtrees[-1] \
                         else math.trunc(subtree.data_size
                                         * height / self.data_size)
 
-                    subtree.update_rectangles((x_coord, y_coord,
+                    subtree._update_rectangle((x_coord, y_coord,
                                                width, new_height))
-                    subtree.update_colours_and_depths()
                     y_coord += new_height
 
+    def _update_rectangle(self, rect: Tuple[int, int, int, int]) -> None:
+        """Lays out this subtree in <rect>, unless it is already laid out
+        there.
+        """
+        if rect != self.rect:
+            self.update_rectangles(rect)
+
     def get_rectangles(self) -> List[Tuple[Tuple[int, int, int, int],
                                            Tuple[int, int, int]]]:
         """Returns a list with tuples for every leaf in the displayed-tree
@@ -302,25 +329,29 @@ class TMTree:
         #          nodes which are affected. (i.e., one leaf node size being
         #          modified results in size changes for its ancestral nodes)
         #
-        if self.is_empty():
-            self.data_size = 0
-            # update the depths and colours of the tree
-            self.update_colours_and_depths()
-            return 0
+        # The mutators below keep the sizes right as they go, so this is
+        # only needed after changing data_size directly. The depths and
+        # colours only need to be updated once, after all of the sizes.
+        data_size = self._update_sizes()
+        self.update_colours_and_depths()
+        return data_size
 
-        elif self._subtrees == []:
-            # update the depths and colours of the tree
-            self.update_colours_and_depths()
-            return self.data_size
+    def _update_sizes(self) -> int:
+        """Helper for update_data_sizes, which leaves the depths and colours
+        as they are, and marks the layout of every tree with subtrees out of
+        date.
 
-        else:
-            data_size = 0
-            for subtree in self._subtrees:
-                data_size += subtree.update_data_sizes()
-            self.data_size = data_size
-            # update the depths and colours of the tree
-            self.update_colours_and_depths()
-            return self.data_size
+        A leaf whose data_size was set directly leaves no trace, and its
+        parent's total can stay the same while the shares of its subtrees
+        change, so no layout below this tree can be trusted.
+        """
+        if self.is_empty():
+            self.data_size = 0
+        elif self._subtrees:
+            self.data_size = sum(subtree._update_sizes()
+                                 for subtree in self._subtrees)
+            self.rect = STALE_RECT
+        return self.data_size
 
     def change_size(self, factor: float) -> None:
         """Changes the value of this tree's data_size attribute by <factor>.
@@ -335,8 +366,9 @@ class TMTree:
         #        - the lower limit on data_size is 1 (i.e., you can't let the
         #          size decrease below 1)
         # since we are not making any changes to the "structure" of the tree
-        # we don't need to call update_colours_and_depths
-        if not self._subtrees:
+        # we don't need to call update_colours_and_depths, and only the
+        # sizes of the ancestors change
+        if self._is_leaf():
             change = math.ceil(self.data_size * factor)
 
             if factor < 0:
@@ -344,10 +376,31 @@ class TMTree:
                 if self.data_size == 0:
                     return
                 elif self.data_size + change < 1:
-                    self.data_size = 1
-                    return
+                    change = 1 - self.data_size
 
-            self.data_size += change
+            self._add_to_sizes(change)
+
+    def _add_to_sizes(self, delta: int) -> None:
+        """Adds <delta> to the data_size of this tree and of each of its
+        ancestors, which is all that a change of <delta> to the size of this
+        tree changes, and marks their layouts out of date.
+
+        Call this with a <delta> of 0 after changing the subtrees of this
+        tree without changing its size.
+        """
+        tree = self
+        while tree is not None:
+            tree.data_size += delta
+            tree.rect = STALE_RECT
+            tree = tree._parent_tree
+
+    def _root(self) -> TMTree:
+        """Returns the root of the tree that this tree is part of.
+        """
+        tree = self
+        while tree._parent_tree is not None:
+            tree = tree._parent_tree
+        return tree
 
     def delete_self(self) -> bool:
         """Removes the current node from the visualization and
@@ -367,16 +420,16 @@ class TMTree:
             self.update_colours_and_depths()
             return False
 
-        if len(self._parent_tree._subtrees) > 1:
-            self._parent_tree._subtrees.remove(self)
-            self._parent_tree.data_size -= self.data_size
-            self.update_colours_and_depths()
+        parent = self._parent_tree
+        parent._subtrees.remove(self)
+        parent._add_to_sizes(-self.data_size)
+        if parent._subtrees:
+            # the deepest leaf may have been deleted, which changes the
+            # shades of all the folders
+            parent._root().update_colours_and_depths()
             return True
         else:
-            self._parent_tree._subtrees.remove(self)
-            self._parent_tree.data_size -= self.data_size
-            self.update_colours_and_depths()
-            return self._parent_tree.delete_self()
+            return parent.delete_self()
 
     # **************************************************************************
     # ************* TASK 5: UPDATE_COLOURS_AND_DEPTHS **************************
@@ -426,7 +479,7 @@ class TMTree:
             self._colour = get_colour()
 
         for subtree in self._subtrees:
-            if subtree._subtrees == []:
+            if subtree._is_leaf():
                 pass
             else:
                 subtree._colour = (step_size, step_size, step_size)
@@ -458,6 +511,10 @@ class TMTree:
     def expand(self) -> None:
         """Sets this tree to be expanded. But not if it is a leaf.
         """
+        root = self._root()
+        rect = root.rect
+        if self._load():
+            root._show_loaded(rect)
         if self._subtrees:
             self._expanded = True
 
@@ -465,12 +522,23 @@ class TMTree:
         """Sets this tree and all its descendants to be expanded, apart from the
         leaf nodes.
         """
-        if not self._subtrees:
-            pass
-        else:
+        # Everything below is loaded first, so that the whole tree is laid
+        # out and coloured once, not once for each folder that loads.
+        root = self._root()
+        rect = root.rect
+        if self._expand_all_helper():
+            root._show_loaded(rect)
+
+    def _expand_all_helper(self) -> bool:
+        """Helper for expand_all, which returns whether any subtrees were
+        loaded."""
+        loaded = self._load()
+        if self._subtrees:
             self._expanded = True
             for subtree in self._subtrees:
-                subtree.expand_all()
+                if subtree._expand_all_helper():
+                    loaded = True
+        return loaded
 
     def collapse(self) -> None:
         """Collapses the parent tree of the given tree node and also collapse
@@ -518,14 +586,21 @@ class TMTree:
         """If this tree is a leaf, and <destination> is not a leaf, moves this
         tree to be the last subtree of <destination>. Otherwise, does nothing.
         """
-        if (not self._subtrees) and destination._subtrees:
+        loaded = destination._load()
+        if self._is_leaf() and destination._subtrees:
             # remove all traces of subtree from its current parent tree
             if self._parent_tree:
                 self._parent_tree._subtrees.remove(self)
-                self._parent_tree.data_size -= self.data_size
+                self._parent_tree._add_to_sizes(-self.data_size)
             # transfer the tree to the destination
             self._parent_tree = destination
             destination._subtrees.append(self)
+            destination._add_to_sizes(self.data_size)
+            self._depth = destination._depth + 1
+            # the tree may be deeper or shallower now
+            self._root().update_colours_and_depths()
+        elif loaded:
+            destination._root().update_colours_and_depths()
 
     def duplicate(self) -> Optional[TMTree]:
         """Duplicates the given tree, if it is a leaf node. It stores
@@ -535,12 +610,17 @@ class TMTree:
         #
         # NOTES: - make good use of the FileSystemTree constructor to
         #          instantiate a new node.
-        if not self._subtrees:
+        if self._is_leaf():
             duplicate = FileSystemTree(self.get_full_path())
             duplicate._parent_tree = self._parent_tree
             duplicate._depth = self._depth
             if self._parent_tree:
                 self._parent_tree._subtrees.append(duplicate)
+                self._parent_tree._add_to_sizes(duplicate.data_size)
+                if duplicate._subtrees:
+                    # a folder emptied in the visualiser is read again from
+                    # disk, and may make the tree deeper
+                    self._root().update_colours_and_depths()
             return duplicate
         else:
             return None
@@ -550,12 +630,47 @@ class TMTree:
         copies the given, and moves the copy to the last subtree of
         <destination>. Otherwise, does nothing.
         """
-        if (not self._subtrees) and destination._subtrees:
-            copy = self.duplicate()
-            copy._parent_tree._subtrees.remove(copy)
+        loaded = destination._load()
+        if self._is_leaf() and destination._subtrees:
+            copy = FileSystemTree(self.get_full_path())
             copy._parent_tree = destination
             copy._depth = destination._depth + 1
             destination._subtrees.append(copy)
+            destination._add_to_sizes(copy.data_size)
+            if loaded or copy._subtrees or copy._depth > self._depth:
+                # the copy may be the deepest part of the tree now
+                copy._root().update_colours_and_depths()
+        elif loaded:
+            destination._root().update_colours_and_depths()
+
+    # **************************************************************************
+    # ************* HOOKS FOR TREES THAT LOAD THEIR SUBTREES LATER *************
+    # **************************************************************************
+    def _is_leaf(self) -> bool:
+        """Returns whether this tree is a leaf. A tree whose subtrees have
+        not been loaded yet is not a leaf, even though it has no subtrees.
+        """
+        return not self._subtrees
+
+    def _load(self) -> bool:
+        """Loads the subtrees of this tree, if they have not been loaded
+        yet, and returns whether any were. Every subtree of a TMTree is loaded
+        when it is made.
+
+        Loaded subtrees get depths one more than this tree's, and this tree
+        and its ancestors are marked out of date, but the caller must lay out
+        and colour the whole tree again, once for all the trees it loads.
+        """
+        return False
+
+    def _show_loaded(self, rect: Tuple[int, int, int, int]) -> None:
+        """Lays this tree, a root whose subtrees were loaded, out again in
+        <rect>, the rectangle it had before, unless it had not been laid out,
+        and updates its depths and colours.
+        """
+        if rect != STALE_RECT:
+            self.update_rectangles(rect)
+        self.update_colours_and_depths()
 
     # **************************************************************************
     # ************* HELPER FUNCTION FOR TESTING PURPOSES  **********************
@@ -630,6 +745,13 @@ class FileSystemTree(TMTree):
 
         Precondition: <my_path> is a valid path for this computer.
         """
+        self._init_path(my_path)
+        self.update_colours_and_depths()
+
+    def _init_path(self, my_path: str) -> None:
+        """Initializes this tree and its subtrees from <my_path>, leaving the
+        depths and colours for the caller to update once, from the root.
+        """
         # 1. Initialize the single attribute: self._path
         # 2. Implement the algorithm described in the handout.
         #
@@ -641,9 +763,11 @@ class FileSystemTree(TMTree):
             list_of_files = os.listdir(my_path)
             for file in list_of_files:
                 # recursively add each subtree to the subtrees list
-                subtrees.append(FileSystemTree(os.path.join(my_path, file)))
+                subtree = FileSystemTree.__new__(FileSystemTree)
+                subtree._init_path(os.path.join(my_path, file))
+                subtrees.append(subtree)
 
-        TMTree.__init__(self, os.path.basename(my_path), subtrees, data_size)
+        self._init_node(os.path.basename(my_path), subtrees, data_size)
 
         self._path = my_path
         # NOTES: - Review OS module documentation summary provided!
@@ -652,6 +776,25 @@ class FileSystemTree(TMTree):
         #          initializer. Thus, set data_size = 0 for the folders
         #
 
+    @classmethod
+    def from_scan(cls, my_path: str, subtrees: List[FileSystemTree],
+                  data_size: int) -> FileSystemTree:
+        """Returns the tree for <my_path> made from its already built
+        <subtrees>, or, for a file, its <data_size>, without reading the file
+        system again. This is how a scanner that has already listed and
+        sized every entry assembles the same tree as the initializer.
+
+        Like _init_node, this does not set depths and colours: call
+        update_colours_and_depths on the root once the tree is complete.
+
+        Precondition: <subtrees> is empty if <my_path> is a file, and
+        <data_size> is 0 if it is a folder.
+        """
+        tree = cls.__new__(cls)
+        tree._init_node(os.path.basename(my_path), subtrees, data_size)
+        tree._path = my_path
+        return tree
+
     def get_full_path(self) -> str:
         """Returns the file path for the tree object.
         """
@@ -673,11 +816,12 @@ class FileSystemTree(TMTree):
             return convert_size(data_size / 1024, suffixes[suffix])
 
         components = []
-        if len(self._subtrees) == 0:
+        if self._is_leaf():
             components.append('file')
         else:
             components.append('folder')
-            components.append(f'{len(self._subtrees)} items')
+            if self._subtrees:
+                components.append(f'{len(self._subtrees)} items')
         components.append(convert_size(self.data_size))
         return f' ({", ".join(components)})'
 
@@ -28,6 +28,14 @@ from typing import Optional
 import pygame
 
 from tm_trees import TMTree, FileSystemTree
+from fs_scanner import Scanner
+from fs_watcher import Watcher
+from hit_index import HitIndex
+from lazy_tree import LazyFileSystemTree
+from layout_engine import layout
+
+# How often to apply the changes found by a watcher, in milliseconds.
+WATCH_INTERVAL = 500
 
 
 class Visualiser:
@@ -41,6 +49,8 @@ class Visualiser:
     screen: Optional[pygame.Surface]
     hover_node: Optional[TMTree]
     selected_node: Optional[TMTree]
+    watcher: Optional[Watcher]
+    hit_index: Optional[HitIndex]
 
     def __init__(self) -> None:
         # You may adjust the height and width as you'd like, depending on your screen resolution
@@ -53,6 +63,8 @@ class Visualiser:
         self.screen = None
         self.hover_node = None
         self.selected_node = None
+        self.watcher = None
+        self.hit_index = None
 
     def run_visualisation(self, tree: TMTree) -> None:
         """Display an interactive graphical display of the given tree's treemap.
@@ -65,8 +77,9 @@ class Visualiser:
 
         # Render the initial display of the static treemap.
         self.render_display()
-        tree.update_rectangles((0, 0, self.width, self.height - self.font_height))
+        layout(tree, (0, 0, self.width, self.height - self.font_height))
         tree.update_colours_and_depths()
+        self.hit_index = HitIndex(tree)
 
         # Start an event loop to respond to events.
         self.event_loop()
@@ -121,6 +134,7 @@ class Visualiser:
         This loop ends only when the user closes the window.
         """
         selected_node = self.tree
+        next_watch = 0
 
         while True:
             # Wait for an event
@@ -134,8 +148,13 @@ class Visualiser:
                 self.run_visualisation(self.tree)
                 return
 
+            if self.watcher is not None and \
+                    pygame.time.get_ticks() >= next_watch:
+                next_watch = pygame.time.get_ticks() + WATCH_INTERVAL
+                self._apply_file_system_changes()
+
             # get the hover position and the corresponding node
-            hover_node = self.tree.get_tree_at_position(pygame.mouse.get_pos())
+            hover_node = self.hit_index.tree_at(pygame.mouse.get_pos())
 
             if event.type == pygame.MOUSEBUTTONUP:
                 selected_node = \
@@ -146,29 +165,24 @@ class Visualiser:
                 k = event.key
                 if k == pygame.K_UP:
                     selected_node.change_size(0.01)
-                    self.tree.update_data_sizes()
                     self.tree.update_rectangles((0, 0, self.width, drawable_height))
 
                 elif k == pygame.K_DOWN:
                     selected_node.change_size(-0.01)
-                    self.tree.update_data_sizes()
                     self.tree.update_rectangles((0, 0, self.width, drawable_height))
 
                 elif k == pygame.K_DELETE or platform == 'darwin' and k == pygame.K_BACKSPACE:
                     if selected_node.delete_self():
-                        self.tree.update_data_sizes()
                         self.tree.update_rectangles((0, 0, self.width, drawable_height))
                         selected_node = None
 
                 elif k == pygame.K_m:
                     selected_node.move(hover_node)
-                    self.tree.update_data_sizes()
                     self.tree.update_rectangles((0, 0, self.width, drawable_height))
                     selected_node = hover_node
 
                 elif k == pygame.K_v:
                     selected_node.copy_paste(hover_node)
-                    self.tree.update_data_sizes()
                     self.tree.update_rectangles((0, 0, self.width, drawable_height))
                     selected_node = hover_node
 
@@ -182,7 +196,6 @@ class Visualiser:
 
                 elif k == pygame.K_d:
                     selected_node.duplicate()
-                    self.tree.update_data_sizes()
                     self.tree.update_rectangles((0, 0, self.width, drawable_height))
 
                     selected_node = None
@@ -200,6 +213,9 @@ class Visualiser:
                     self.run_visualisation(selected_node)
                     return
 
+                # the keys above may have laid out parts of the tree again
+                self.hit_index.clear()
+
             if event.type == pygame.KEYUP and event.key == pygame.K_b:
                 if self.tree.get_parent():
                     self.tree.get_parent().collapse_all()
@@ -212,6 +228,23 @@ class Visualiser:
             # Update display
             self.render_display()
 
+    def _apply_file_system_changes(self) -> None:
+        """Apply the changes the watcher found since it was last polled,
+        laying out again only the parts of the treemap whose layout changed.
+        """
+        for region in self.watcher.poll():
+            self.hit_index.clear()
+            # Inside the displayed tree, the region keeps its rectangle; if
+            # it holds the displayed tree, all of the display is laid out.
+            node = region
+            while node is not None and node is not self.tree:
+                node = node.get_parent()
+            if node is None:
+                self.tree.update_rectangles(
+                    (0, 0, self.width, self.height - self.font_height))
+            else:
+                region.update_rectangles(region.rect)
+
     def _handle_click(self, button: int, pos: tuple[int, int],
                       old_selected_leaf: Optional[TMTree]) -> Optional[TMTree]:
         """Return the new selection after handling the mouse event.
@@ -222,7 +255,7 @@ class Visualiser:
 
         # left mouse click
         if button == 1:
-            selected_leaf = self.tree.get_tree_at_position(pos)
+            selected_leaf = self.hit_index.tree_at(pos)
             if selected_leaf is None:
                 return old_selected_leaf
             elif selected_leaf is old_selected_leaf:
@@ -254,8 +287,15 @@ class Visualiser:
             return leaf_path + leaf.get_suffix()
 
 
-def run_treemap_file_system(path: str) -> None:
+def run_treemap_file_system(path: str, lazy: bool = False,
+                            snapshot: Optional[str] = None,
+                            watch: bool = False) -> None:
     """Run a treemap visualisation for the given path's file structure.
+    If <lazy> is True, folders are only read when they are first expanded.
+    If <snapshot> is given, the scan reuses and updates that snapshot file,
+    so only the folders that changed since the last run are listed again.
+    If <watch> is True and <lazy> is False, changes made to the folder while
+    it is displayed are shown as they happen.
     Precondition: <path> is a valid path to a file or folder.
     """
     instructions = '\n==== Instructions for use ====\n' \
@@ -273,7 +313,15 @@ def run_treemap_file_system(path: str) -> None:
                    '"V" to duplicate a copy and paste a file (while selecting a file and hovering over a folder)\n' \
                    '(Drag window to resize)'
 
-    file_tree = FileSystemTree(path)
+    if snapshot is None:
+        file_tree = LazyFileSystemTree(path) if lazy else FileSystemTree(path)
+    elif lazy and os.path.isdir(path):
+        sizes = Scanner(snapshot=snapshot).folder_sizes(path)
+        file_tree = LazyFileSystemTree(path, sizes)
+    else:
+        file_tree = Scanner(snapshot=snapshot).scan(path)
+    if watch and not lazy and os.path.isdir(path):
+        visualizer.watcher = Watcher(file_tree)
     print(instructions)
     visualizer.run_visualisation(file_tree)
 